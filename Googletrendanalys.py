@@ -1,590 +1,2623 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-from pytrends.request import TrendReq
+import time
+started_at = time.perf_counter()
+
+# tkinter and plotly are imported inside the functions that need them,
+# so the command line entry point starts quickly and runs without a display
+from pytrends.request import TrendReq, BASE_TRENDS_URL
 import pandas as pd
-import plotly.graph_objs as go
-import plotly.io as pio
-import plotly.express as px
+import numpy as np
 import webbrowser
-import time
 import math
+import multiprocessing
 import os
-from bs4 import BeautifulSoup
+import sys
+import argparse
 import json
+import csv
+import itertools
 import re
+import hashlib
+import html
+import pickle
+import threading
+import contextvars
+import queue
+from contextlib import contextmanager
+import random
+import warnings
+import requests
+from pytrends import exceptions as pytrends_exceptions
+from collections import namedtuple, Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import pyarrow  # Used by pandas for the Parquet cache files
+    cache_format = "parquet"
+except ImportError:
+    cache_format = "pickle"
 
 # Pagination parameters for the HTML output
 items_per_page = 100
 
-# Function to calculate averages
-def calculate_averages(data, term):
-    if data[term].isnull().all() or data[term].sum() == 0:
-        print(f"Warning: No data found for term '{term}' globally.")
-        return 0, 0, 0, 0  # Return zeros if no data
-
-    # Proceed with normal calculation if data is available
-    current_year = data.index[-1].year
-    current_month = data.index[-1].month
-    current_week = data.index[-1].isocalendar()[1]
-
-    year_data = data[data.index.year == current_year]
-    month_data = data[(data.index.year == current_year) & (data.index.month == current_month)]
-    week_data = data[(data.index.year == current_year) & (data.index.isocalendar().week == current_week)]
-
-    last_year_data = data[data.index.year == current_year - 1]
-    last_year_avg = last_year_data[term].mean() if not last_year_data.empty else year_data[term].mean()
+# Cache parameters for Google Trends responses
+cache_dir = os.path.join(os.path.expanduser("~"), ".google_trends_cache")
+cache_ttl = 24 * 60 * 60  # Seconds before a cached response is considered stale
+cache_max_bytes = 200 * 1024 * 1024  # Least recently used entries are evicted above this size
+cache_evict_to = 0.9  # Fraction of cache_max_bytes left after an eviction, so the directory is rarely scanned
+
+# Timeframe parameters
+timeframe_choices = ["today 1-m", "today 3-m", "today 12-m", "today 5-y", "all"]
+daily_span_days = 269  # Longest span Google returns one point per day for
+stitch_window_days = 90  # Length of each daily window when stitching a longer span
+stitch_overlap_days = 30  # Days each window shares with the next one, used to put them on one scale
+settled_days = 3  # Google still revises the last few days; windows ending before that no longer change
+history_cache_ttl = 365 * 24 * 60 * 60  # Seconds a cached window that no longer changes is kept
+
+# Fetch scheduling parameters
+fetch_workers = 4  # Number of requests in flight at once
+request_rate = 0.5  # Requests per second allowed across all workers
+request_burst = 3  # Requests that may be sent back to back before the rate applies
+min_request_rate = 0.02  # Slowest rate the limiter backs off to after repeated 429s
+rate_increase = 0.05  # Requests per second added back after each successful request
+rate_decrease = 0.5  # Factor applied to the rate after a 429
+backoff_time = 60  # Initial pause in seconds after a 429, doubled for consecutive 429s
+transient_retry_time = 5  # Initial wait in seconds before retrying a network error
+rate_jitter = 0.2  # Random +/- fraction applied to every wait
+
+# Client pool parameters
+client_pool_size = fetch_workers  # Number of pooled Trends clients, one per worker is enough
+trends_base_url = BASE_TRENDS_URL  # Point this at a local stand-in server for testing
+trends_proxies = []  # Optional proxy URLs, e.g. "https://host:port", rotated across the pooled clients
+request_timeout = (5, 30)  # Connect and read timeouts in seconds
+
+# Snapshot store parameters; the store needs pyarrow and is off without it
+store_dir = os.path.join(os.path.expanduser("~"), ".google_trends_store")
+store_snapshots = True  # Append the data of every run to the store
+refresh_max_age = 24 * 60 * 60  # Seconds before stored data is fetched again in refresh mode
+
+# Trend analytics parameters
+slope_window_days = 90  # The trend column is the slope over this many most recent days
+yoy_window_days = 28  # Most recent days compared with the same days a year earlier
+anomaly_window_days = 90  # Each point is compared with the points in this many days before it
+anomaly_zscore = 3.0  # Points further than this many standard deviations from that window are anomalies
+peak_zscore = 2.0  # Local highs this many standard deviations above a term's mean count as peaks
+
+# Term clustering parameters
+cluster_min_terms = 10  # Terms are only clustered from this many terms with data on
+cluster_count = 0  # Number of clusters; 0 picks it from the number of terms, up to max_clusters
+max_clusters = 8
+correlation_chunk_terms = 512  # Rows of the correlation matrix computed at once, bounding the memory used
+heatmap_max_terms = 200  # Past this many terms the heatmap shows the most typical terms of every cluster
+cluster_chart_terms = 10  # Most typical terms drawn in each cluster's chart, next to the cluster average
+
+# Report settings
+report_assets = "shared"  # "shared" writes plotly.js and the maps next to the report, "inline" puts everything in one page
+webgl_trace_threshold = 50  # Past this many series the chart is drawn with WebGL and without markers
+max_points_per_series = 1000  # Longer series are downsampled (LTTB) before they are written; 0 keeps every point
+visible_series = 0  # Only show the top N terms at first, the rest can be turned on from the legend; 0 shows all
+report_payload_id = "trendsPayload"  # Element id of the data payload embedded in every report
+render_workers = 0  # Processes the maps are rendered on; 0 uses every core, 1 renders them in this process
+parallel_render_min_terms = 20  # Fewer maps than this are rendered in this process, a pool would not pay off
+
+# Instrumentation settings
+latency_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Upper bounds in seconds of the latency histogram buckets
+
+# Instrumentation of a run: timed spans for every stage, request and sleep, latency histograms, counters
+# and events such as errors. The fetch workers share it, so every update is made under a lock
+class RunMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.perf_counter()
+            self.spans = []
+            self.events = []
+            self.histograms = {}
+            self.counters = {}
+
+    @contextmanager
+    def span(self, name, category="stage", histogram=None, **args):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, category, started, time.perf_counter() - started, histogram, **args)
+
+    def record(self, name, category, started, seconds, histogram=None, **args):
+        with self.lock:
+            self.spans.append((name, category, started - self.started, seconds, threading.get_native_id(), args))
+            if histogram:
+                self.histograms.setdefault(histogram, []).append(seconds)
+
+    def add(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def event(self, name, **args):
+        with self.lock:
+            self.events.append((name, time.perf_counter() - self.started, threading.get_native_id(), args))
+
+    def _histogram_summary(self, values):
+        values = np.asarray(values)
+        counts = np.bincount(np.searchsorted(latency_buckets, values), minlength=len(latency_buckets) + 1)
+        labels = [f"<={bound}s" for bound in latency_buckets] + [f">{latency_buckets[-1]}s"]
+        return {
+            "count": len(values),
+            "total_seconds": float(values.sum()),
+            "mean": float(values.mean()),
+            "p50": float(np.percentile(values, 50)),
+            "p90": float(np.percentile(values, 90)),
+            "p99": float(np.percentile(values, 99)),
+            "max": float(values.max()),
+            "buckets": dict(zip(labels, counts.tolist())),
+        }
 
-    year_avg = year_data[term].mean()
-    month_avg = month_data[term].mean()
-    week_avg = week_data[term].mean()
+    def summary(self):
+        with self.lock:
+            spans = list(self.spans)
+            histograms = {name: list(values) for name, values in self.histograms.items()}
+            counters = dict(self.counters)
+            event_count = len(self.events)
+
+        stages = {}
+        for name, category, _, seconds, _, _ in spans:
+            if category == "stage":
+                stage = stages.setdefault(name, {"count": 0, "seconds": 0.0})
+                stage["count"] += 1
+                stage["seconds"] += seconds
+        return {
+            "wall_seconds": time.perf_counter() - self.started,
+            "stages": stages,
+            "requests": {name: self._histogram_summary(values) for name, values in histograms.items()},
+            "counters": counters,
+            "events": event_count,
+        }
 
-    return year_avg, month_avg, week_avg, last_year_avg
+    # Function to get the spans and events in the trace event format read by chrome://tracing and Perfetto
+    def trace_events(self):
+        pid = os.getpid()
+        with self.lock:
+            events = [{"name": name, "cat": category, "ph": "X", "ts": round(start * 1e6, 1),
+                       "dur": round(seconds * 1e6, 1), "pid": pid, "tid": thread, "args": args}
+                      for name, category, start, seconds, thread, args in self.spans]
+            events += [{"name": name, "cat": "event", "ph": "i", "s": "t", "ts": round(start * 1e6, 1),
+                        "pid": pid, "tid": thread, "args": args}
+                       for name, start, thread, args in self.events]
+        return events
+
+    # Function to write the summary and the trace events to one JSON file, which trace viewers can open as is
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(), "traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f,
+                      default=str)
+
+    def summary_lines(self):
+        summary = self.summary()
+        lines = []
+        stages = ", ".join(f"{name} {stage['seconds']:.2f}s" for name, stage in summary["stages"].items())
+        lines.append(f"Timing: {stages or 'no stages'} (wall {summary['wall_seconds']:.2f}s)")
+        for name, latency in summary["requests"].items():
+            lines.append(f"Requests {name}: {latency['count']}, latency p50 {latency['p50']:.2f}s, "
+                         f"p90 {latency['p90']:.2f}s, p99 {latency['p99']:.2f}s, max {latency['max']:.2f}s")
+        counters = summary["counters"]
+        sleeps = {name.split(".", 1)[1]: value for name, value in counters.items() if name.startswith("sleep_seconds.")}
+        if sleeps:
+            lines.append(f"Slept {sum(sleeps.values()):.2f}s ("
+                         + ", ".join(f"{reason} {seconds:.2f}s" for reason, seconds in sleeps.items()) + ")")
+        errors = {name.split(".", 1)[1]: value for name, value in counters.items() if name.startswith("errors.")}
+        if errors:
+            lines.append("Errors: " + ", ".join(f"{count} {kind}" for kind, count in errors.items()))
+        if counters.get("cache_hits") or counters.get("cache_misses"):
+            lines.append(f"Cache: {counters.get('cache_hits', 0)} hits, {counters.get('cache_misses', 0)} misses "
+                         f"(saved about {counters.get('cache_saved_seconds', 0):.1f} seconds of fetching)")
+        if counters.get("bytes_written"):
+            lines.append(f"Wrote {counters['bytes_written'] / 1024 / 1024:.2f} MB")
+        return lines
+
+    def report(self):
+        for line in self.summary_lines():
+            print(line)
+
+    # Function to render the summary as the report footer
+    def footer_html(self):
+        items = "".join(f"\n        <li>{line}</li>" for line in self.summary_lines())
+        return f"""
+<div class="run-metrics">
+    <h2>Run Metrics</h2>
+    <ul>{items}
+    </ul>
+</div>
+"""
+
+run_metrics = RunMetrics()
+
+# The metrics of the run on the current thread; each ComparisonRun sets its own, and fetch workers inherit it
+active_metrics = contextvars.ContextVar("active_metrics", default=None)
+
+def current_metrics():
+    return active_metrics.get() or run_metrics
+
+# Function to check whether a Trends base URL is Google's rather than a stand-in server
+def is_google_url(base_url):
+    return base_url.rstrip("/") == BASE_TRENDS_URL.rstrip("/")
+
+# On-disk cache of Google Trends responses, keyed by the full request parameters
+class TrendsCache:
+    def __init__(self, directory=cache_dir, ttl=cache_ttl, max_bytes=cache_max_bytes):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.size = None  # Running total of the entry sizes, known after the first scan of the directory
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def make_key(self, kind, group, geo, timeframe, cat=0, gprop='', hl='en-US', tz=360, base_url=BASE_TRENDS_URL):
+        # The term order does not change the response, so the key uses the sorted group. Responses from a
+        # stand-in server are keyed by its URL so they are never returned for Google; Google's keep their old key
+        key = [kind, sorted(group), geo, timeframe, cat, gprop, hl, tz]
+        if not is_google_url(base_url):
+            key.append(base_url.rstrip("/"))
+        return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.{cache_format}")
+
+    def get(self, key, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        path = self._path(key)
+        try:
+            modified = os.path.getmtime(path)
+        except OSError:
+            self._count(hit=False)
+            return None
+
+        if time.time() - modified > ttl:
+            self._discard(path)
+            self._count(hit=False)
+            return None
+
+        try:
+            if cache_format == "parquet":
+                data = pd.read_parquet(path)
+            else:
+                data = pd.read_pickle(path)
+        except Exception as e:
+            print(f"Error reading cache entry {key}: {str(e)}. Refetching.")
+            self._discard(path)
+            self._count(hit=False)
+            return None
+
+        # Record the access time so eviction removes the least recently used entries first
+        os.utime(path, (time.time(), modified))
+        self._count(hit=True, saved_seconds=data.attrs.get("fetch_seconds", 0))
+        return data
+
+    def _count(self, hit, saved_seconds=0):
+        # Fetch workers share the cache, so the counters are updated under a lock. The totals cover every run
+        # in the process; each run also counts its own in its metrics
+        with self.lock:
+            if hit:
+                self.hits += 1
+                self.saved_seconds += saved_seconds
+            else:
+                self.misses += 1
+        metrics = current_metrics()
+        if hit:
+            metrics.add("cache_hits")
+            metrics.add("cache_saved_seconds", saved_seconds)
+        else:
+            metrics.add("cache_misses")
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def put(self, key, data, fetch_seconds=0):
+        os.makedirs(self.directory, exist_ok=True)
+        data = data.copy()
+        data.attrs["fetch_seconds"] = fetch_seconds
+        path = self._path(key)
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            if cache_format == "parquet":
+                data.to_parquet(temp_path)
+            else:
+                data.to_pickle(temp_path)
+            added = os.path.getsize(temp_path)
+            try:
+                added -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f"Error writing cache entry {key}: {str(e)}")
+            self._discard(temp_path)
+            return
 
+        # The directory is only scanned once, and again whenever the running total goes over the cap
+        with self.lock:
+            if self.size is not None:
+                self.size += added
+            over = self.size is None or self.size > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_atime, info.st_size, path))
+            total_size += info.st_size
+
+        # Evict down to below the cap, so the next scans are many writes away
+        entries.sort()
+        for accessed, size, path in entries:
+            if total_size <= self.max_bytes * cache_evict_to:
+                break
+            self._discard(path)
+            total_size -= size
+        with self.lock:
+            self.size = total_size
+
+    def totals(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "saved_seconds": self.saved_seconds}
+
+trends_cache = TrendsCache()
+
+# Local append-only store of every run's data, for history beyond one timeframe and reports without requests.
+# Each merged frame is written as a Parquet file partitioned by kind, geo and fetch date, one row per term
+# and date (or location) with the scaled value, the value Google returned, the scale factor and the anchor
+class TrendsStore:
+    def __init__(self, directory=store_dir):
+        self.directory = directory
+
+    # Geo '' is the worldwide data
+    def _geo_name(self, geo):
+        return geo or "world"
+
+    def _key_column(self, kind):
+        return "date" if kind == "interest_over_time" else "location"
+
+    def append(self, kind, geo, data, timeframe, fetched_at=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if data.empty:
+            return None
+        fetched_at = fetched_at or pd.Timestamp.now(tz="UTC").floor("s")
+        key = self._key_column(kind)
+
+        rows = pd.DataFrame({
+            key: np.tile(data.index.to_numpy(), len(data.columns)),
+            "term": np.repeat(data.columns.to_numpy(dtype=object), len(data)),
+            "value": data.to_numpy(dtype=float).T.ravel(),
+        }).dropna(subset=["value"])
+        rows["scale"] = rows["term"].map(data.attrs.get("scale_factors", {})).fillna(1.0)
+        rows["raw"] = (rows["value"] / rows["scale"]).astype(np.float32)
+        rows["value"] = rows["value"].astype(np.float32)
+        rows["anchor"] = data.attrs.get("anchor") or ""
+        rows["timeframe"] = timeframe
+        rows["fetched_at"] = fetched_at
+
+        directory = os.path.join(self.directory, f"kind={kind}", f"geo={self._geo_name(geo)}",
+                                 f"fetch_date={fetched_at:%Y-%m-%d}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{fetched_at:%H%M%S}-{os.urandom(4).hex()}.parquet")
+        pq.write_table(pa.Table.from_pandas(rows, preserve_index=False), path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return path
+
+    # Function to load the stored rows for a set of terms; only the matching partitions are read, through
+    # memory-mapped files. With latest only the newest snapshot of each term is kept
+    def load(self, terms=None, geo='', kind="interest_over_time", since=None, until=None, latest=True,
+             timeframe=None, columns=None):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        directory = os.path.join(self.directory, f"kind={kind}")
+        if not os.path.isdir(directory):
+            return pd.DataFrame(columns=columns or [self._key_column(kind), "term", "value", "scale", "raw",
+                                                    "anchor", "timeframe", "fetched_at", "fetch_date"])
+
+        partitioning = ds.partitioning(pa.schema([("geo", pa.string()), ("fetch_date", pa.string())]),
+                                       flavor="hive")
+        dataset = ds.dataset(directory, format="parquet", partitioning=partitioning,
+                             filesystem=fs.LocalFileSystem(use_mmap=True), exclude_invalid_files=True)
+        condition = ds.field("geo") == self._geo_name(geo)
+        if terms is not None:
+            condition &= ds.field("term").isin(list(terms))
+        if since is not None:
+            condition &= ds.field("fetch_date") >= f"{pd.Timestamp(since):%Y-%m-%d}"
+        if until is not None:
+            condition &= ds.field("fetch_date") <= f"{pd.Timestamp(until):%Y-%m-%d}"
+        if timeframe is not None:
+            condition &= ds.field("timeframe") == timeframe
+        rows = dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+        if latest and not rows.empty:
+            rows = rows[rows["fetched_at"] == rows.groupby("term")["fetched_at"].transform("max")]
+        return rows.drop(columns=["geo"], errors="ignore").reset_index(drop=True)
+
+    # Function to get when each of the terms was last stored
+    def fetched_times(self, terms, geo='', kind="interest_over_time", timeframe=None):
+        rows = self.load(terms, geo, kind, latest=False, timeframe=timeframe, columns=["term", "fetched_at"])
+        return rows.groupby("term")["fetched_at"].max()
+
+    # Function to load the newest stored data of a set of terms as a frame with a column per term, like the
+    # merged frames of a run. Terms whose newest data comes from different runs are on different scales, so
+    # every older run is brought onto the scale of the newest one through the terms they share
+    def load_frame(self, terms=None, geo='', kind="interest_over_time", timeframe=None):
+        rows = self.load(terms, geo, kind, latest=False, timeframe=timeframe)
+        key = self._key_column(kind)
+        index_name = "date" if kind == "interest_over_time" else "geoName"
+        if rows.empty:
+            return pd.DataFrame(index=pd.Index([], name=index_name))
+
+        newest = rows.groupby("term")["fetched_at"].max()
+        snapshots = sorted(set(newest), reverse=True)
+        data = None
+        factors = {}
+        for fetched_at in snapshots:
+            snapshot_rows = rows[rows["fetched_at"] == fetched_at]
+            snapshot = snapshot_rows.pivot_table(index=key, columns="term", values="value", aggfunc="last")
+            factor = 1.0
+            if data is not None and kind == "interest_over_time":
+                shared = [term for term in snapshot.columns if term in data.columns]
+                dates = data.index.intersection(snapshot.index)
+                reference = np.nansum(data.loc[dates, shared].to_numpy())
+                total = np.nansum(snapshot.loc[dates, shared].to_numpy())
+                if reference > 0 and total > 0:
+                    factor = reference / total
+                else:
+                    print(f"Warning: stored data from {fetched_at} shares no terms with newer data; "
+                          f"it is shown on its own scale.")
+            # Only the terms whose newest data is in this snapshot are taken from it
+            own = [term for term in snapshot.columns if newest[term] == fetched_at]
+            part = snapshot[own] * factor
+            data = part if data is None else pd.concat([data, part], axis=1)
+            scale = snapshot_rows.groupby("term")["scale"].last()
+            factors.update({term: float(scale[term] * factor) for term in own})
+
+        data = data.sort_index().astype(float)
+        if kind == "interest_over_time" and len(snapshots) > 1:
+            peak = np.nanmax(data.to_numpy()) if data.notna().any().any() else 0
+            if peak > 0:
+                data = data * (100.0 / peak)
+                factors = {term: factor * 100.0 / peak for term, factor in factors.items()}
+        if terms is not None:
+            data = data[[term for term in terms if term in data.columns]]
+        data.columns.name = None
+        data.index.name = index_name
+
+        data.attrs["scale_factors"] = factors
+        data.attrs["anchor"] = rows.loc[rows["fetched_at"] == snapshots[0], "anchor"].iloc[0] or None
+        data.attrs["fetched_at"] = newest.to_dict()
+        return data
+
+trends_store = TrendsStore() if cache_format == "parquet" else None
+
+# Function to turn a Trends timeframe into its first and last day; returns None for the hourly
+# "now" timeframes and anything else it doesn't understand
+def parse_timeframe(timeframe, today=None):
+    today = pd.Timestamp(today if today is not None else pd.Timestamp.now()).normalize()
+    try:
+        if timeframe == "all":
+            return pd.Timestamp("2004-01-01"), today
+        if timeframe.startswith("today "):
+            amount, unit = timeframe.split(" ")[1].split("-")
+            offset = {"d": pd.DateOffset(days=int(amount)), "m": pd.DateOffset(months=int(amount)),
+                      "y": pd.DateOffset(years=int(amount))}[unit]
+            return today - offset, today
+        start, end = timeframe.split(" ")
+        return pd.Timestamp(start), pd.Timestamp(end)
+    except (KeyError, ValueError):
+        return None
+
+# Function to get how long a cached response for a timeframe stays valid; a window that ended a while ago
+# no longer changes, so it is kept much longer and extending a range only fetches the new part
+def timeframe_cache_ttl(timeframe):
+    span = parse_timeframe(timeframe)
+    if span is not None and span[1] < pd.Timestamp.now().normalize() - pd.Timedelta(days=settled_days):
+        return history_cache_ttl
+    return None
+
+# Function to split a timeframe longer than Google's daily limit into overlapping daily windows.
+# The windows sit on a fixed grid from 2004, so the same windows come back on every run and only
+# the newest one changes as the range grows
+def stitch_timeframes(timeframe, window=stitch_window_days, overlap=stitch_overlap_days, today=None):
+    span = parse_timeframe(timeframe, today)
+    if span is None or (span[1] - span[0]).days <= daily_span_days:
+        return [timeframe]
+
+    start, end = span
+    epoch = pd.Timestamp("2004-01-01")
+    step = window - overlap
+    windows = []
+    window_start = epoch + pd.Timedelta(days=max(0, (start - epoch).days // step) * step)
+    while True:
+        window_end = min(window_start + pd.Timedelta(days=window - 1), end)
+        windows.append(f"{window_start:%Y-%m-%d} {window_end:%Y-%m-%d}")
+        if window_end >= end:
+            return windows
+        window_start += pd.Timedelta(days=step)
+
+# Function to stitch the overlapping daily windows of one group into a single frame. Google scales each
+# window with one factor for all terms of the group, so every window is scaled onto the next newer one by
+# the ratio of their totals over the days they share, for all terms at once
+def stitch_frames(parts):
+    columns = parts[0].columns
+    index = parts[0].index
+    for part in parts[1:]:
+        index = index.union(part.index)
+    values = np.stack([part.reindex(index=index, columns=columns).to_numpy(dtype=float) for part in parts])
+
+    factors = np.ones(len(parts))
+    for i in range(len(parts) - 2, -1, -1):
+        shared = ~np.isnan(values[i]).all(axis=1) & ~np.isnan(values[i + 1]).all(axis=1)
+        older = np.nansum(values[i][shared])
+        newer = np.nansum(values[i + 1][shared]) * factors[i + 1]
+        if older > 0 and newer > 0:
+            factors[i] = newer / older
+        else:
+            print(f"Warning: no overlap to scale the window ending {index[shared][-1:].tolist() or index[0]} "
+                  f"for {list(columns)}; it is kept on the scale of the next window.")
+            factors[i] = factors[i + 1]
+
+    # Days covered by two windows get the mean of both
+    scaled = values * factors[:, np.newaxis, np.newaxis]
+    counts = (~np.isnan(scaled)).sum(axis=0)
+    stitched = np.where(counts > 0, np.nansum(scaled, axis=0) / np.maximum(counts, 1), np.nan)
+    peak = np.nanmax(stitched) if np.isfinite(stitched).any() else 0
+    if peak > 0:
+        stitched = stitched * (100.0 / peak)
+    return pd.DataFrame(stitched, index=index, columns=columns)
+
+# Function to put the window jobs of each group back together; jobs are in the order fetch_comparison
+# queues them, with the windows of a group next to each other. A group with a failed window fails
+def stitch_job_frames(jobs, frames, timeframe, window_count):
+    start, end = parse_timeframe(timeframe)
+    stitched_jobs = []
+    stitched_frames = []
+    i = 0
+    while i < len(jobs):
+        job = jobs[i]
+        if job.kind != "interest_over_time":
+            stitched_jobs.append(job)
+            stitched_frames.append(frames[i])
+            i += 1
+            continue
+        parts = frames[i:i + window_count]
+        stitched_jobs.append(job._replace(timeframe=timeframe))
+        stitched_frames.append(None if any(part is None for part in parts) else stitch_frames(parts).loc[start:end])
+        i += window_count
+    return stitched_jobs, stitched_frames
+
+# Function to fetch interest over time for a group of terms, using the cache when possible
+def fetch_interest_over_time(pytrends, group, geo='', timeframe='today 12-m', cache=None, limiter=None):
+    key = None
+    if cache is not None:
+        key = cache.make_key("interest_over_time", group, geo, timeframe, hl=pytrends.hl, tz=pytrends.tz,
+                             base_url=getattr(pytrends, "base_url", BASE_TRENDS_URL))
+        data = cache.get(key, timeframe_cache_ttl(timeframe))
+        if data is not None:
+            return data[group]
+
+    if limiter is not None:
+        limiter.acquire()
+
+    start = time.time()
+    with current_metrics().span("interest_over_time", "request", "interest_over_time", terms=group, geo=geo):
+        # build_payload keeps the previous geo when given '', so reset it explicitly
+        pytrends.geo = geo
+        pytrends.build_payload(group, cat=0, timeframe=timeframe, geo=geo, gprop='')
+        data = pytrends.interest_over_time()[group]
+
+    if cache is not None:
+        cache.put(key, data, time.time() - start)
+    return data
+
+# Function to fetch interest by region for a group of terms, using the cache when possible
+def fetch_interest_by_region(pytrends, group, geo='', timeframe='today 12-m', cache=None, limiter=None):
+    key = None
+    if cache is not None:
+        key = cache.make_key("interest_by_region", group, geo, timeframe, hl=pytrends.hl, tz=pytrends.tz,
+                             base_url=getattr(pytrends, "base_url", BASE_TRENDS_URL))
+        data = cache.get(key, timeframe_cache_ttl(timeframe))
+        if data is not None:
+            return data[group]
+
+    if limiter is not None:
+        limiter.acquire()
+
+    start = time.time()
+    with current_metrics().span("interest_by_region", "request", "interest_by_region", terms=group, geo=geo):
+        pytrends.geo = geo
+        pytrends.build_payload(group, cat=0, timeframe=timeframe, geo=geo, gprop='')
+        data = pytrends.interest_by_region(resolution='COUNTRY', inc_low_vol=True)[group]
+
+    if cache is not None:
+        cache.put(key, data, time.time() - start)
+    return data
+
+fetch_functions = {
+    "interest_over_time": fetch_interest_over_time,
+    "interest_by_region": fetch_interest_by_region,
+}
+
+# A single fetch request: up to 5 terms for one geo ('' is worldwide) and one kind of data
+FetchJob = namedtuple("FetchJob", ["group", "geo", "kind", "timeframe"], defaults=["interest_over_time", "today 12-m"])
+
+# Raised inside fetch workers once a run has been cancelled
+class FetchCancelled(Exception):
+    pass
+
+# Shared token bucket so all fetch workers together stay under the allowed request rate
+class TokenBucket:
+    def __init__(self, rate=request_rate, burst=request_burst, cancel_event=None):
+        self.rate = rate  # Requests per second
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.slept_seconds = 0.0
+        self.cancel_event = cancel_event or threading.Event()
+
+    def _next_wait(self):
+        # Returns 0 and takes a token if one is available, otherwise the time until the next one
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self, cancel_event=None):
+        # A limiter shared by several runs is passed each run's own cancel event
+        cancel_event = cancel_event or self.cancel_event
+        while True:
+            if cancel_event.is_set():
+                raise FetchCancelled()
+            with self.lock:
+                wait = self._next_wait()
+                reason = self._wait_reason()
+            if wait <= 0:
+                return
+            self.sleep(wait, reason, cancel_event)
+
+    def _wait_reason(self):
+        return "rate_limit"
+
+    def sleep(self, seconds, reason="rate_limit", cancel_event=None):
+        # Waiting on the cancel event lets a cancelled run stop in the middle of a long backoff
+        started = time.monotonic()
+        with current_metrics().span(reason, "sleep"):
+            cancelled = (cancel_event or self.cancel_event).wait(seconds)
+        slept = time.monotonic() - started
+        with self.lock:
+            self.slept_seconds += slept
+        current_metrics().add(f"sleep_seconds.{reason}", slept)
+        if cancelled:
+            raise FetchCancelled()
+
+# Token bucket that adapts its rate to the 429s it observes (additive increase, multiplicative decrease)
+class AdaptiveRateLimiter(TokenBucket):
+    def __init__(self, rate=request_rate, burst=request_burst, min_rate=min_request_rate,
+                 increase=rate_increase, decrease=rate_decrease, backoff=backoff_time, jitter=rate_jitter,
+                 cancel_event=None):
+        super().__init__(rate, burst, cancel_event)
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.backoff = backoff
+        self.jitter = jitter
+        self.blocked_until = 0.0  # All workers pause until this time after a 429
+        self.consecutive_limits = 0
+        self.rate_limited_count = 0
+        # Every pause starts a new episode; a request remembers the episode it was sent in, so the 429s of
+        # requests already in flight when a pause began are not counted as new ones
+        self.episode = 0
+        self.sent = threading.local()
+
+    def _jittered(self, seconds):
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _next_wait(self):
+        blocked = self.blocked_until - time.monotonic()
+        if blocked > 0:
+            return blocked
+        wait = super()._next_wait()
+        return self._jittered(wait) if wait > 0 else 0
+
+    def _wait_reason(self):
+        return "backoff_429" if self.blocked_until > time.monotonic() else "rate_limit"
+
+    def acquire(self, cancel_event=None):
+        super().acquire(cancel_event)
+        self.sent.episode = self.episode
+
+    def _in_current_episode(self):
+        return getattr(self.sent, "episode", self.episode) == self.episode
+
+    def on_success(self):
+        with self.lock:
+            if self._in_current_episode():
+                self.consecutive_limits = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_rate_limited(self):
+        # Slow down for the rest of the run and pause every worker; returns the pause length. One throttling
+        # episode is one slowdown and one backoff step, however many requests were in flight when it began
+        with self.lock:
+            self.rate_limited_count += 1
+            if not self._in_current_episode():
+                return max(0.0, self.blocked_until - time.monotonic())
+            self.episode += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            delay = self._jittered(self.backoff * 2 ** self.consecutive_limits)
+            self.consecutive_limits += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            # Tokens only build up again once the pause is over, so it does not end in a burst
+            self.tokens = 0
+            self.updated = self.blocked_until
+            return delay
+
+    def wait_before_retry(self, attempt, base=transient_retry_time, cancel_event=None):
+        # Exponential backoff for transient errors that do not affect the shared rate
+        self.sleep(self._jittered(base * 2 ** attempt), "retry_backoff", cancel_event)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "rate": self.rate,
+                "slept_seconds": self.slept_seconds,
+                "rate_limited": self.rate_limited_count,
+                "paused_for": max(0.0, self.blocked_until - time.monotonic()),
+            }
 
-# Function to fetch and plot Google Trends data
-# Function to fetch and plot Google Trends data
-def plot_trends(search_terms, region1=None, region2=None, generate_map=False):
-    global stats
+# One run's handle on a limiter shared with other runs: they all draw from the same rate and back off together
+# after a 429, but waits end early only for the run that was cancelled
+class LimiterLease:
+    def __init__(self, limiter, cancel_event=None):
+        self.limiter = limiter
+        self.cancel_event = cancel_event or threading.Event()
+
+    def acquire(self):
+        self.limiter.acquire(self.cancel_event)
+
+    def sleep(self, seconds, reason="rate_limit"):
+        self.limiter.sleep(seconds, reason, self.cancel_event)
+
+    def wait_before_retry(self, attempt, base=transient_retry_time):
+        self.limiter.wait_before_retry(attempt, base, self.cancel_event)
+
+    def __getattr__(self, name):
+        return getattr(self.limiter, name)
+
+# Function to decide whether a failed fetch should be retried
+def classify_fetch_error(error):
+    if isinstance(error, pytrends_exceptions.TooManyRequestsError) or "429" in str(error):
+        return "rate_limited"
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return "transient"
+    if isinstance(error, pytrends_exceptions.ResponseError):
+        status = getattr(error.response, "status_code", None)
+        if status is not None and status >= 500:
+            return "transient"
+    return "permanent"
+
+# TrendReq that sends every request through one persistent session (keep-alive and cookies)
+# instead of opening a new session per request, and that can talk to another base URL
+class PooledTrendReq(TrendReq):
+    def __init__(self, hl='en-US', tz=360, base_url=trends_base_url, proxy=None, cookies=None,
+                 timeout=request_timeout):
+        self.base_url = base_url.rstrip("/")
+        self.proxy = proxy
+        self.shared_cookies = cookies
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if proxy:
+            self.session.proxies.update({"https": proxy, "http": proxy})
+        super().__init__(hl=hl, tz=tz, timeout=timeout)
+
+    def GetGoogleCookie(self):
+        # Reuse the cookie another pooled client already fetched instead of a new bootstrap request
+        if self.shared_cookies is not None:
+            return self.shared_cookies
+        response = self.session.get(f"{self.base_url}/explore/?geo={self.hl[-2:]}", timeout=self.timeout)
+        return dict(filter(lambda i: i[0] == 'NID', response.cookies.items()))
+
+    def _get_data(self, url, method=TrendReq.GET_METHOD, trim_chars=0, **kwargs):
+        url = self.base_url + url[len(BASE_TRENDS_URL):] if url.startswith(BASE_TRENDS_URL) else url
+        self.session.headers.update(self.headers)
+        if method == TrendReq.POST_METHOD:
+            response = self.session.post(url, timeout=self.timeout, cookies=self.cookies, **kwargs)
+        else:
+            response = self.session.get(url, timeout=self.timeout, cookies=self.cookies, **kwargs)
+
+        content_type = response.headers.get('Content-Type', '')
+        if response.status_code == 200 and any(kind in content_type for kind in
+                                               ('application/json', 'application/javascript', 'text/javascript')):
+            # Some responses start with garbage characters like ")]}'," that have to be trimmed
+            return json.loads(response.text[trim_chars:])
+        if response.status_code == 429:
+            raise pytrends_exceptions.TooManyRequestsError.from_response(response)
+        raise pytrends_exceptions.ResponseError.from_response(response)
+
+# Pool of Trends clients shared by all fetch workers, created on first use
+class TrendsClientPool:
+    def __init__(self, size=client_pool_size, hl='en-US', tz=360, base_url=trends_base_url, proxies=None):
+        self.size = size
+        self.hl = hl
+        self.tz = tz
+        self.base_url = base_url
+        self.proxies = list(trends_proxies if proxies is None else proxies)
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.rotation = 0  # Index of the proxy the next new client uses
+        self.cookies = {}  # Bootstrap cookies per base URL and proxy, shared by the clients using them
+        self.bootstraps = {}  # Lock per base URL and proxy, held while its first client fetches the cookie
+        self.lock = threading.Lock()
+
+    def _create(self):
+        with self.lock:
+            proxy = self.proxies[self.rotation % len(self.proxies)] if self.proxies else None
+            self.rotation += 1
+            origin = (self.base_url, proxy)
+            bootstrap = self.bootstraps.setdefault(origin, threading.Lock())
+        # Clients created at the same time wait for the first one's cookie instead of each fetching their own
+        with bootstrap:
+            with self.lock:
+                cookies = self.cookies.get(origin)
+            pytrends = PooledTrendReq(hl=self.hl, tz=self.tz, base_url=self.base_url, proxy=proxy, cookies=cookies)
+            with self.lock:
+                self.cookies.setdefault(origin, pytrends.cookies)
+        return pytrends
+
+    def _release_slot(self):
+        with self.lock:
+            self.created -= 1
+
+    def _checkout(self):
+        while True:
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self.lock:
+                can_create = self.created < self.size
+                if can_create:
+                    self.created += 1
+            if can_create:
+                try:
+                    return self._create()
+                except Exception:
+                    self._release_slot()
+                    raise
+
+            try:
+                return self.idle.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    @contextmanager
+    def client(self):
+        pytrends = self._checkout()
+        try:
+            yield pytrends
+        except requests.exceptions.ProxyError:
+            # Drop a client whose proxy failed; its replacement uses the next proxy in the rotation
+            pytrends.session.close()
+            self._release_slot()
+            raise
+        except BaseException:
+            self.idle.put(pytrends)
+            raise
+        else:
+            self.idle.put(pytrends)
+
+    def close(self):
+        while True:
+            try:
+                pytrends = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            pytrends.session.close()
+            self._release_slot()
+
+trends_client_pool = TrendsClientPool()
+
+# Append-only journal of a run's fetches: every finished job is written with its frame as soon as it arrives,
+# so an interrupted run can be resumed without fetching those jobs again. Records are length-prefixed pickles,
+# and a record cut short by a crash is dropped when the journal is resumed
+class FetchJournal:
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.replayed = 0
+        self.failed = 0  # Requests of the run that did not complete, so the journal is still needed
+        if resume and os.path.exists(path):
+            self.file = open(path, "r+b")
+            self.file.truncate(self._read())
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(path, "wb")
+
+    @staticmethod
+    def key(job):
+        return (tuple(job.group), job.geo, job.kind, job.timeframe)
+
+    def _read(self):
+        # Returns the end of the last complete record
+        end = 0
+        with open(self.path, "rb") as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    break
+                size = int.from_bytes(header, "little")
+                record = f.read(size)
+                if len(record) < size:
+                    break
+                try:
+                    key, data = pickle.loads(record)
+                except Exception:
+                    break
+                self.entries[key] = data
+                end = f.tell()
+        return end
+
+    def get(self, job):
+        data = self.entries.get(self.key(job))
+        if data is not None:
+            with self.lock:
+                self.replayed += 1
+        return data
+
+    def append(self, job, data):
+        # Pickling happens outside the lock; the write itself is one small append, flushed to the OS
+        record = pickle.dumps((self.key(job), data), protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.file.write(len(record).to_bytes(8, "little") + record)
+            self.file.flush()
+
+    def close(self, remove=False):
+        self.file.close()
+        if remove:
+            os.remove(self.path)
+
+# Function to get the journal file of a report, next to it
+def journal_path(output_dir=".", filename=None):
+    return os.path.join(output_dir, f"{os.path.splitext(filename or 'google_trends_comparison.html')[0]}.journal")
+
+# Runs fetch jobs on a bounded worker pool behind a shared rate limiter
+class FetchScheduler:
+    def __init__(self, max_workers=fetch_workers, limiter=None, cache=None, max_retries=5, pool=None,
+                 progress=None, journal=None):
+        self.max_workers = max_workers
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.cache = cache
+        self.max_retries = max_retries
+        self.pool = pool or trends_client_pool
+        self.progress = progress  # Called with a progress event dict after every finished job
+        self.journal = journal  # Jobs already in the journal are replayed, new ones are added to it
+        self.cancel_event = self.limiter.cancel_event
+
+    def _run_job(self, job):
+        if self.journal is not None:
+            data = self.journal.get(job)
+            if data is not None:
+                return data
+        for attempt in range(self.max_retries):
+            if self.cancel_event.is_set():
+                return None
+            try:
+                fetch = fetch_functions[job.kind]
+                # TrendReq is not thread safe, so each job checks a client out of the pool
+                with self.pool.client() as pytrends:
+                    data = fetch(pytrends, job.group, job.geo, job.timeframe, cache=self.cache, limiter=self.limiter)
+                self.limiter.on_success()
+                if self.journal is not None:
+                    self.journal.append(job, data)
+                return data
+            except FetchCancelled:
+                return None
+            except Exception as e:
+                error_type = classify_fetch_error(e)
+                current_metrics().add(f"errors.{error_type}")
+                current_metrics().event("fetch_error", error=error_type, terms=job.group, geo=job.geo, message=str(e))
+                if error_type == "rate_limited":
+                    delay = self.limiter.on_rate_limited()
+                    print(f"Rate limit exceeded. Pausing requests for {delay:.0f} seconds before retrying...")
+                elif error_type == "transient" and attempt < self.max_retries - 1:
+                    print(f"Network error with terms {job.group}: {str(e)}. Retrying...")
+                    try:
+                        self.limiter.wait_before_retry(attempt)
+                    except FetchCancelled:
+                        return None
+                else:
+                    print(f"Error with terms {job.group}: {str(e)}. Skipping these terms.")
+                    return None
+        print(f"Giving up on terms {job.group} after {self.max_retries} attempts.")
+        current_metrics().event("fetch_gave_up", terms=job.group, geo=job.geo)
+        return None
+
+    def _report_progress(self, done, total, started):
+        if self.progress is None:
+            return
+        elapsed = time.monotonic() - started
+        metrics = self.limiter.metrics()
+        self.progress({
+            "stage": "fetch",
+            "done": done,
+            "total": total,  # None while the jobs are still being read
+            "backoff": metrics["paused_for"],
+            "rate": metrics["rate"],
+            "eta": elapsed / done * (total - done) if done and total else None,
+        })
+
+    # Function to run the jobs, which can be a generator still producing them, e.g. from a term file being read:
+    # only a few jobs are queued ahead of the workers, so the first ones are fetched while the rest is read.
+    # Returns the frame of every job in job order, None for the failed ones
+    def run_jobs(self, jobs):
+        total = len(jobs) if hasattr(jobs, "__len__") else None
+        frames = []
+        pending = {}
+        started = time.monotonic()
+        done = 0
+
+        def collect(finished):
+            nonlocal done
+            for future in finished:
+                frames[pending.pop(future)] = future.result()
+                done += 1
+                self._report_progress(done, total, started)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for job in jobs:
+                # Workers run in a copy of the caller's context so their spans go to the caller's run
+                pending[executor.submit(contextvars.copy_context().run, self._run_job, job)] = len(frames)
+                frames.append(None)
+                if len(pending) >= 2 * self.max_workers:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            total = len(frames)
+            collect(as_completed(list(pending)))
+        return frames
+
+    def run(self, jobs):
+        return collect_job_frames(jobs, self.run_jobs(jobs))
+
+# Function to collect the group frames per (kind, geo), keeping the original job order;
+# returns them with the jobs that failed
+def collect_job_frames(jobs, frames):
+    results = {}
+    failed_jobs = []
+    for job, data in zip(jobs, frames):
+        if data is None:
+            failed_jobs.append(job)
+            continue
+        results.setdefault((job.kind, job.geo), []).append(data)
+    return results, failed_jobs
+
+# Function to split terms into 5-term groups that all share the anchor term
+def build_anchor_groups(search_terms, anchor=None):
+    if anchor is None or len(search_terms) <= 5:
+        return [search_terms[i:i+5] for i in range(0, len(search_terms), 5)]
+
+    others = [term for term in search_terms if term != anchor]
+    return [[anchor] + others[i:i+4] for i in range(0, len(others), 4)]
+
+# Function to make the same groups as build_anchor_groups while the terms are still coming in, yielding each
+# group as soon as its terms are read; without an anchor the first term is used
+def iter_anchor_groups(terms, anchor=None):
+    terms = iter(terms)
+    head = list(itertools.islice(terms, 6))
+    if len(head) <= 5:
+        if head:
+            yield head
+        return
 
+    anchor = head[0] if anchor is None else anchor
+    others = (term for term in itertools.chain(head, terms) if term != anchor)
+    while True:
+        group = list(itertools.islice(others, 4))
+        if not group:
+            return
+        yield [anchor] + group
+
+# Function to queue the fetch jobs of a comparison group by group as the terms come in: every geo (and daily
+# window) of a group straight away, and the worldwide region interest of every term as it is read. Region
+# interest is fetched one term at a time: with several terms Google splits each country between them, and
+# no rescaling turns that share back into the term's own interest
+def comparison_jobs(terms, regions, anchor, timeframe, windows):
+    region_terms = []
+
+    def read_terms():
+        for term in terms:
+            region_terms.append(term)
+            yield term
+
+    for group in iter_anchor_groups(read_terms(), anchor):
+        for geo in [''] + regions:
+            for window in windows:
+                yield FetchJob(group, geo, "interest_over_time", window)
+        for term in region_terms:
+            yield FetchJob([term], '', "interest_by_region", timeframe)
+        region_terms.clear()
+    for term in region_terms:
+        yield FetchJob([term], '', "interest_by_region", timeframe)
+
+# Function to merge group frames onto one common scale using the shared anchor term
+def merge_group_frames(parts, anchor=None):
+    if not parts:
+        return pd.DataFrame(), []
+
+    if anchor is None or len(parts) == 1 or any(anchor not in part.columns for part in parts):
+        data = pd.concat(parts, axis=1)
+        return data.loc[:, ~data.columns.duplicated()], []
+
+    # Every group is normalized to 100 on its own, so compare the anchor across groups
+    # and scale each group by how much its anchor total differs from the reference group
+    index = parts[0].index
+    for part in parts[1:]:
+        index = index.union(part.index)
+    anchors = np.column_stack([part[anchor].reindex(index).to_numpy(dtype=float) for part in parts])
+    anchor_totals = np.nansum(anchors, axis=0)
+    reference = anchor_totals.argmax()  # The group where the anchor has the best resolution
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factors = np.where(anchor_totals > 0, anchor_totals[reference] / anchor_totals, np.nan)
+
+    # Keep the anchor only from the reference group and scale every column in one operation
+    kept = []
+    column_factors = []
+    seen = set()
+    for i, part in enumerate(parts):
+        columns = [term for term in part.columns
+                   if term not in seen and (term != anchor or i == reference)]
+        seen.update(columns)
+        kept.append(part[columns].reindex(index))
+        column_factors.extend([factors[i]] * len(columns))
+
+    data = pd.concat(kept, axis=1)
+    columns = list(data.columns)
+    column_factors = np.array(column_factors)
+    values = data.to_numpy(dtype=float) * column_factors[np.newaxis, :]
+    peak = np.nanmax(values) if np.isfinite(values).any() else 0
+    if peak > 0:
+        values = values * (100.0 / peak)
+
+    scaled = pd.DataFrame(values, index=index, columns=columns)
+    unscaled_terms = [term for term, factor in zip(columns, column_factors) if np.isnan(factor)]
+    if unscaled_terms:
+        print(f"Anchor term '{anchor}' had no data alongside {unscaled_terms}; they cannot be compared.")
+    scaled = scaled.drop(columns=unscaled_terms)
+
+    scaled.attrs["anchor"] = anchor
+    scaled.attrs["scale_factors"] = {term: float(factor * (100.0 / peak if peak > 0 else 1.0))
+                                     for term, factor in zip(columns, column_factors) if not np.isnan(factor)}
+    return scaled, unscaled_terms
+
+# Function to merge the single-term interest by region frames into one frame with a column per term
+def merge_region_interest(parts):
+    if not parts:
+        return pd.DataFrame()
+
+    # Every part holds one term, already scaled by Google to its own top country
+    data = pd.concat(parts, axis=1)
+    return data.loc[:, ~data.columns.duplicated()].fillna(0)
+
+# Function to calculate the latest value and the year, month, week and last year averages
+# for every column at once; the periods are the calendar year, month and ISO week of the last date
+def compute_period_stats(data, label="globally"):
+    columns = ["latest", "year_avg", "month_avg", "week_avg", "last_year_avg"]
+    if data.empty:
+        return pd.DataFrame(columns=columns, dtype=float)
+
+    index = data.index
+    last = index[-1]
+    values = data.to_numpy(dtype=float)
+
+    year_mask = index.year == last.year
+    month_mask = year_mask & (index.month == last.month)
+    week_start = last.normalize() - pd.Timedelta(days=last.weekday())
+    week_mask = year_mask & (index >= week_start)
+    last_year_mask = index.year == last.year - 1
+
+    # Mean of the selected rows for every column in one operation
+    def period_mean(mask):
+        if not mask.any():
+            return np.full(values.shape[1], np.nan)
+        with np.errstate(invalid='ignore'):
+            return np.nanmean(values[mask], axis=0)
+
+    year_avg = period_mean(year_mask)
+    last_year_avg = period_mean(last_year_mask) if last_year_mask.any() else year_avg
+
+    # The latest value is the last one each term has, since merged reports can end on different dates
+    stats = pd.DataFrame({
+        "latest": data.ffill().to_numpy(dtype=float)[-1],
+        "year_avg": year_avg,
+        "month_avg": period_mean(month_mask),
+        "week_avg": period_mean(week_mask),
+        "last_year_avg": last_year_avg,
+    }, index=data.columns)
+
+    # Terms without any data get zeros, as before
+    no_data = np.isnan(values).all(axis=0) | (np.nansum(values, axis=0) == 0)
+    if no_data.any():
+        for term in data.columns[no_data]:
+            print(f"Warning: No data found for term '{term}' {label}.")
+        stats.loc[no_data, ["year_avg", "month_avg", "week_avg", "last_year_avg"]] = 0
+    return stats
+
+# Function to get the typical number of days between the points of a series
+def point_spacing_days(index):
+    if len(index) < 2:
+        return 1.0
+    return max(float(np.median(np.diff(index.as_unit("s").asi8))) / 86400, 1 / 24)
+
+# Function to compute the trend analytics for every column at once: the recent slope, year over year growth,
+# seasonality strength, anomalies and peaks. Each is a vectorized operation over the whole matrix, so the
+# cost grows linearly with the number of terms
+def compute_trend_analytics(data):
+    columns = ["slope", "yoy_growth", "seasonality", "latest_z", "anomalies", "peaks", "peak_date"]
+    if data.empty:
+        return pd.DataFrame(columns=columns, index=data.columns)
+
+    index = data.index
+    values = data.to_numpy(dtype=np.float32)
+    valid = ~np.isnan(values)
+    spacing = point_spacing_days(index)
+    days = ((index - index[-1]) / pd.Timedelta(days=1)).to_numpy()
+    analytics = pd.DataFrame(index=data.columns)
+
+    # Terms without data in a window get NaN, which numpy warns about for every such slice
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        # Least squares slope over the most recent window, in interest points per week
+        recent = (days > -slope_window_days) & valid.any(axis=1)
+        x = np.where(valid[recent], days[recent, np.newaxis] / 7, np.nan)
+        y = values[recent]
+        x_mean = np.nanmean(x, axis=0)
+        y_mean = np.nanmean(np.where(valid[recent], y, np.nan), axis=0)
+        analytics["slope"] = (np.nansum((x - x_mean) * (y - y_mean), axis=0)
+                              / np.nansum((x - x_mean) ** 2, axis=0))
+
+        # Year over year growth of the most recent window, in percent
+        latest = np.nanmean(values[days > -yoy_window_days], axis=0)
+        year_ago = (days <= -365) & (days > -365 - yoy_window_days)
+        previous = np.nanmean(values[year_ago], axis=0) if year_ago.any() else np.full(values.shape[1], np.nan)
+        analytics["yoy_growth"] = np.where(previous > 0, (latest - previous) / previous * 100, np.nan)
+
+        # Seasonality strength, as in STL: 1 - Var(remainder) / Var(detrended), where the trend is a centred
+        # one year moving average and the seasonal part the mean of the detrended values per week (or month)
+        per_year = max(int(round(365.25 / spacing)), 2)
+        if len(data) >= 2 * per_year:
+            frame = pd.DataFrame(values, index=index)
+            detrended = frame - frame.rolling(per_year, center=True, min_periods=per_year // 2).mean()
+            bucket = index.month if spacing > 20 else index.isocalendar().week.to_numpy()
+            remainder = detrended - detrended.groupby(bucket).transform("mean")
+            strength = 1 - remainder.var(axis=0).to_numpy() / detrended.var(axis=0).to_numpy()
+            analytics["seasonality"] = np.clip(strength, 0, 1)
+        else:
+            analytics["seasonality"] = np.nan
+
+        # z-scores of every point against the window before it; the latest one and the number of anomalies
+        window = max(int(round(anomaly_window_days / spacing)), 3)
+        frame = pd.DataFrame(values, index=index)
+        rolling = frame.rolling(window, min_periods=max(window // 2, 2))
+        zscores = ((frame - rolling.mean().shift(1)) / rolling.std().shift(1)).to_numpy()
+        zscores = np.where(np.isfinite(zscores), zscores, np.nan)
+        analytics["latest_z"] = pd.DataFrame(zscores).ffill().to_numpy()[-1]
+        analytics["anomalies"] = (np.abs(np.nan_to_num(zscores)) > anomaly_zscore).sum(axis=0)
+
+        # Peaks: local highs well above the term's own mean, and the date of the highest point
+        mean = np.nanmean(values, axis=0)
+        std = np.nanstd(values, axis=0)
+        filled = np.nan_to_num(values, nan=-np.inf)
+        local_high = np.zeros_like(valid)
+        local_high[1:-1] = (filled[1:-1] > filled[:-2]) & (filled[1:-1] >= filled[2:])
+        analytics["peaks"] = (local_high & (values > mean + peak_zscore * std)).sum(axis=0)
+
+    has_data = valid.any(axis=0)
+    peak_rows = np.argmax(filled, axis=0)
+    analytics["peak_date"] = np.where(has_data, index[peak_rows].strftime("%Y-%m-%d"), None)
+    analytics[columns[:4]] = analytics[columns[:4]].astype(float)
+    return analytics[columns]
+
+# Function to turn every column into a zero mean, unit length float32 vector, so the dot product of two
+# columns is their correlation; gaps count as the column's mean and flat columns stay all zeros
+def trend_shapes(data):
+    values = data.to_numpy(dtype=np.float32)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        shapes = np.nan_to_num(values - np.nanmean(values, axis=0))
+    norms = np.linalg.norm(shapes, axis=0)
+    np.divide(shapes, norms, out=shapes, where=norms > 0)
+    return shapes
+
+# Function to compute the correlation matrix of the shapes a block of rows at a time; every block is
+# chunk x terms float32, so the memory used stays bounded however many terms there are
+def correlation_blocks(shapes, chunk=correlation_chunk_terms):
+    for start in range(0, shapes.shape[1], chunk):
+        yield start, shapes[:, start:start + chunk].T @ shapes
+
+# Function to find, for every term, the other term whose trend correlates most with it
+def most_similar_terms(shapes):
+    count = shapes.shape[1]
+    neighbours = np.zeros(count, dtype=int)
+    similarity = np.full(count, -np.inf, dtype=np.float32)
+    flat = ~shapes.any(axis=0)
+    for start, block in correlation_blocks(shapes):
+        rows = np.arange(len(block))
+        block[rows, start + rows] = -np.inf
+        block[:, flat] = -np.inf
+        neighbours[start:start + len(block)] = np.argmax(block, axis=1)
+        similarity[start:start + len(block)] = block[rows, neighbours[start:start + len(block)]]
+    found = np.isfinite(similarity) & ~flat
+    return np.where(found, neighbours, -1), np.where(found, similarity, np.nan)
+
+# Function to run spherical k-means on the shapes from k-means++ seeds: every term joins the centroid it
+# correlates with most. Returns the cluster index of every term and its correlation with that centroid
+def spherical_kmeans(points, count, rng, iterations=50):
+    rows = np.arange(points.shape[1])
+
+    # k-means++ seeding: each next centroid is a term picked with a chance growing with its distance
+    # (1 - correlation) from the centroids picked so far
+    chosen = [int(rng.integers(len(rows)))]
+    distance = 1 - points.T @ points[:, chosen[0]]
+    for _ in range(1, count):
+        weights = np.clip(distance, 0, None).astype(float)
+        total = weights.sum()
+        chosen.append(int(rng.choice(len(rows), p=weights / total)) if total > 0 else int(rng.integers(len(rows))))
+        distance = np.minimum(distance, 1 - points.T @ points[:, chosen[-1]])
+    centroids = points[:, chosen]
+
+    assigned = None
+    for _ in range(iterations):
+        similarity = points.T @ centroids
+        latest = np.argmax(similarity, axis=1)
+        if assigned is not None and np.array_equal(latest, assigned):
+            break
+        assigned = latest
+        members = np.zeros((len(rows), count), dtype=np.float32)
+        members[rows, assigned] = 1
+        centroids = points @ members
+        norms = np.linalg.norm(centroids, axis=0)
+        # An empty cluster starts again from the terms that fit their own cluster worst
+        empty = np.flatnonzero(norms == 0)
+        if len(empty):
+            worst = np.argsort(similarity[rows, assigned])[:len(empty)]
+            centroids[:, empty[:len(worst)]] = points[:, worst]
+            norms[empty[:len(worst)]] = 1
+        centroids /= np.where(norms > 0, norms, 1)
+
+    similarity = points.T @ centroids
+    assigned = np.argmax(similarity, axis=1)
+    return assigned, similarity[rows, assigned]
+
+# Function to group the terms by the shape of their trend; k-means is run from a few seeds and the grouping
+# the terms fit best is kept. Returns the cluster of every term, 1 being the largest and NaN for flat terms
+# or too few terms, and the term's correlation with its cluster's centroid
+def cluster_terms(shapes, count=cluster_count, restarts=4, seed=0):
+    labels = np.full(shapes.shape[1], np.nan)
+    fit = np.full(shapes.shape[1], np.nan)
+    active = np.flatnonzero(shapes.any(axis=0))
+    if len(active) < cluster_min_terms:
+        return labels, fit
+    points = shapes if len(active) == shapes.shape[1] else shapes[:, active]
+    count = min(count or min(max_clusters, max(2, round(math.sqrt(len(active) / 2)))), len(active))
+
+    rng = np.random.default_rng(seed)
+    assigned, similarity = max((spherical_kmeans(points, count, rng) for _ in range(restarts)),
+                               key=lambda result: float(result[1].sum()))
+
+    # Number the clusters by size, largest first
+    order = np.argsort(-np.bincount(assigned, minlength=count), kind="stable")
+    rank = np.empty(count, dtype=int)
+    rank[order] = np.arange(1, count + 1)
+    labels[active] = rank[assigned]
+    fit[active] = similarity
+    return labels, fit
+
+# Function to compute the similarity columns for every term: its cluster, how well it fits that cluster,
+# the term it correlates with most and that correlation
+def compute_term_similarity(data, count=cluster_count):
+    columns = ["cluster", "cluster_fit", "most_similar", "similarity"]
+    if data.empty:
+        return pd.DataFrame(columns=columns, index=data.columns)
+
+    shapes = trend_shapes(data)
+    similarity = pd.DataFrame(index=data.columns)
+    similarity["cluster"], similarity["cluster_fit"] = cluster_terms(shapes, count)
+    neighbours, correlation = most_similar_terms(shapes)
+    similarity["most_similar"] = np.where(neighbours >= 0, data.columns.to_numpy()[neighbours], None)
+    similarity["similarity"] = correlation.astype(float)
+    return similarity[columns]
+
+# Function to build the stats table: one row per term with the global stats and the averages for each region
+def build_stats(search_terms, all_data, regions, region_data):
+    terms = [term for term in search_terms if term in all_data.columns]
+    with current_metrics().span("stats.periods"):
+        stats = compute_period_stats(all_data[terms])
+    with current_metrics().span("stats.analytics"):
+        stats = stats.join(compute_trend_analytics(all_data[terms]))
+    with current_metrics().span("stats.similarity"):
+        stats = stats.join(compute_term_similarity(all_data[terms]))
+
+    for region in regions:
+        with current_metrics().span("stats.regions", region=region):
+            region_stats = compute_period_stats(region_data[region], f"in {region}").reindex(terms).fillna(0)
+        for period in ("year_avg", "month_avg", "week_avg"):
+            stats[f"{region}_{period}"] = region_stats[period]
+
+    stats = stats.rename_axis("term").reset_index()
+    return stats.sort_values("latest", ascending=False, kind="stable").reset_index(drop=True)
+
+
+# Function to fetch the data for a comparison; returns the merged global frame, the frame of every region,
+# the worldwide region interest and the terms that could not be fetched or scaled
+def fetch_comparison(search_terms, regions, anchor=None, timeframe='today 12-m', rate=request_rate, progress=None,
+                     cancel_event=None, daily=False, journal=None, limiter=None):
+    # With more than 5 terms every group carries a shared anchor term so the groups can be rescaled together:
+    # the given term, even one that is not compared itself, or else the first term. A TermStream is read
+    # while its first groups are already being fetched, so the first term is only known once it is read
+    streaming = isinstance(search_terms, TermStream)
+    if not streaming and anchor is None:
+        anchor = search_terms[0]
+
+    # For daily points over a long span every group is fetched as overlapping daily windows
+    windows = stitch_timeframes(timeframe) if daily else [timeframe]
+    if len(windows) > 1:
+        print(f"Fetching {timeframe} as {len(windows)} overlapping daily windows per group")
+
+    # Queue the global pass, every region pass and the worldwide region interest of each group
+    # and let the scheduler run them together
+    jobs = []
+
+    def queue_jobs():
+        for job in comparison_jobs(search_terms, regions, anchor, timeframe, windows):
+            jobs.append(job)
+            yield job
+
+    # A limiter shared with other runs keeps their requests together under its rate
+    if limiter is not None:
+        limiter = LimiterLease(limiter, cancel_event)
+    else:
+        limiter = AdaptiveRateLimiter(rate=rate, cancel_event=cancel_event)
+    scheduler = FetchScheduler(limiter=limiter, cache=trends_cache, progress=progress, journal=journal)
+    frames = scheduler.run_jobs(queue_jobs() if streaming else list(queue_jobs()))
+    if journal is not None and journal.replayed:
+        print(f"Resumed {journal.replayed} of {len(jobs)} requests from {journal.path}")
+    if streaming:
+        search_terms = search_terms.terms
+        if not search_terms:
+            raise ValueError("Please enter or upload at least one search term.")
+        anchor = search_terms[0] if anchor is None else anchor
+    if len(windows) > 1:
+        jobs, frames = stitch_job_frames(jobs, frames, timeframe, len(windows))
+    results, failed_jobs = collect_job_frames(jobs, frames)
+    if journal is not None:
+        journal.failed = len(failed_jobs)
+    if limiter.cancel_event.is_set():
+        # Keep whatever was fetched before the cancel and report on it
+        print(f"Run cancelled; {len(failed_jobs)} of {len(jobs)} requests were not completed.")
+
+    limiter_metrics = scheduler.limiter.metrics()
+    print(f"Rate limiter: {limiter_metrics['rate_limited']} rate limits, "
+          f"final rate {limiter_metrics['rate']:.2f} requests/s, "
+          f"{limiter_metrics['slept_seconds']:.1f} seconds spent waiting")
+
+    all_data, unscaled_terms = merge_group_frames(results.get(("interest_over_time", ''), []), anchor)
+    region_data = {}
+    for region in regions:
+        region_data[region], region_unscaled = merge_group_frames(results.get(("interest_over_time", region), []), anchor)
+        unscaled_terms.extend(region_unscaled)
+    region_interest = merge_region_interest(results.get(("interest_by_region", ''), []))
+
+    # Record the anchor even when a single group needed no scaling, so later refreshes can scale against it
+    for data in [all_data] + list(region_data.values()):
+        if anchor in data.columns:
+            data.attrs.setdefault("anchor", anchor)
+
+    # A failed group only loses the anchor if no other group returned it
+    missing_terms = []
+    for job in failed_jobs:
+        if job.kind != "interest_over_time":
+            continue
+        missing_terms.extend(term for term in job.group if term not in missing_terms
+                             and (term != anchor or term not in all_data.columns))
+    missing_terms.extend(term for term in dict.fromkeys(unscaled_terms) if term not in missing_terms)
+
+    return all_data, region_data, region_interest, missing_terms
+
+# Function to get the timeframe a run is stored under; stitched daily data is kept apart from
+# the weekly data Google returns for the same timeframe
+def stored_timeframe(timeframe, daily=False):
+    return f"{timeframe} daily" if daily and len(stitch_timeframes(timeframe)) > 1 else timeframe
+
+# Function to append the data of a run to the snapshot store, all with the same fetch time
+def save_comparison(store, all_data, region_data, region_interest, timeframe):
+    fetched_at = pd.Timestamp.now(tz="UTC").floor("s")
     try:
-        if len(search_terms) < 1:
-            messagebox.showerror("Error", "Please enter or upload at least one search term.")
+        store.append("interest_over_time", '', all_data, timeframe, fetched_at)
+        for region, data in region_data.items():
+            store.append("interest_over_time", region, data, timeframe, fetched_at)
+        store.append("interest_by_region", '', region_interest, timeframe, fetched_at)
+    except OSError as e:
+        print(f"Warning: could not save the run to the snapshot store: {e}")
+
+# Function to load the newest stored data for a comparison instead of fetching it; the anchor is loaded
+# along with the terms to put them on one scale, even when it isn't one of them
+def load_stored_comparison(store, search_terms, regions, anchor=None, timeframe=None):
+    terms = list(dict.fromkeys(search_terms + ([anchor] if anchor else [])))
+    all_data = store.load_frame(terms, timeframe=timeframe)
+    region_data = {region: store.load_frame(terms, region, timeframe=timeframe) for region in regions}
+    region_interest = store.load_frame(search_terms, kind="interest_by_region", timeframe=timeframe)
+    if anchor not in search_terms:
+        all_data = all_data.drop(columns=[anchor], errors="ignore")
+        region_data = {region: data.drop(columns=[anchor], errors="ignore") for region, data in region_data.items()}
+    missing_terms = [term for term in search_terms if term not in all_data.columns]
+    return all_data, region_data, region_interest, missing_terms
+
+# Function to get the anchor of the newest stored run with these terms in a timeframe, or else the first term
+def stored_anchor(store, search_terms, timeframe):
+    anchors = store.load(search_terms, latest=False, timeframe=timeframe, columns=["anchor", "fetched_at"])
+    anchors = anchors[anchors["anchor"] != ""].sort_values("fetched_at")["anchor"]
+    return anchors.iloc[-1] if not anchors.empty else search_terms[0]
+
+# Function to bring the stored data for a comparison up to date: only the terms that are new, or whose
+# stored data in any of the regions is older than max_age seconds, are fetched. They are fetched together
+# with the anchor of the newest stored run, so the store can put them on the same scale as the rest
+def refresh_comparison(store, search_terms, regions, anchor=None, timeframe='today 12-m', max_age=refresh_max_age,
+                       rate=request_rate, progress=None, cancel_event=None, daily=False, limiter=None):
+    label = stored_timeframe(timeframe, daily)
+    cutoff = pd.Timestamp.now(tz="UTC") - pd.Timedelta(seconds=max_age)
+    scopes = [("interest_over_time", geo) for geo in [''] + regions] + [("interest_by_region", '')]
+    stale = set()
+    for kind, geo in scopes:
+        fetched = store.fetched_times(search_terms, geo, kind, label)
+        stale.update(term for term in search_terms if term not in fetched.index or fetched[term] < cutoff)
+    to_fetch = [term for term in search_terms if term in stale]
+
+    # Without an anchor given, use the one of the newest stored run with these terms
+    if anchor is None:
+        anchor = stored_anchor(store, search_terms, label)
+    print(f"Refresh: {len(to_fetch)} of {len(search_terms)} terms are new or older than "
+          f"{max_age / 3600:g} hours")
+
+    missing_terms = []
+    if to_fetch:
+        terms = list(dict.fromkeys([anchor] + to_fetch))
+        all_data, region_data, region_interest, missing_terms = fetch_comparison(
+            terms, regions, anchor, timeframe, rate, progress, cancel_event, daily, limiter=limiter)
+        save_comparison(store, all_data, region_data, region_interest, label)
+
+    all_data, region_data, region_interest, stored_missing = load_stored_comparison(
+        store, search_terms, regions, anchor, label)
+    missing_terms = [term for term in search_terms if term in set(missing_terms) | set(stored_missing)]
+    return all_data, region_data, region_interest, missing_terms
+
+# One comparison, from the terms to the written report. Everything a run produces is kept on the object rather
+# than in module globals, so several runs can go at once in one process; they share the response cache and the
+# client pool, and a rate limiter when one is passed in
+class ComparisonRun:
+    def __init__(self, search_terms, regions=None, generate_map=False, anchor=None, timeframe='today 12-m',
+                 output_dir=".", filename=None, rate=request_rate, progress=None, cancel_event=None,
+                 assets=report_assets, visible=visible_series, store=trends_store, from_store=False, refresh=False,
+                 max_age=refresh_max_age, daily=False, metrics_path=None, resume=False, limiter=None):
+        # Remove blanks and duplicates; a TermStream does that itself while it is read during the fetch,
+        # but the store needs the whole list up front
+        self.streaming = isinstance(search_terms, TermStream) and not (from_store or refresh)
+        if not self.streaming:
+            search_terms = list(clean_terms(search_terms))
+            if len(search_terms) < 1:
+                raise ValueError("Please enter or upload at least one search term.")
+        if (from_store or refresh) and store is None:
+            raise ValueError("The snapshot store needs pyarrow; install it to report from stored data.")
+        # The store only ever holds Google's data, so runs against a stand-in server neither read nor save it
+        if not is_google_url(trends_client_pool.base_url):
+            if from_store or refresh:
+                raise ValueError("The snapshot store only holds data from Google Trends; "
+                                 "it can't be used with another base URL.")
+            store = None
+
+        self.search_terms = search_terms
+        self.regions = [region for region in dict.fromkeys(regions or []) if region]
+        self.generate_map = generate_map
+        self.anchor = " ".join(anchor.split()) or None if anchor else None
+        self.timeframe = timeframe
+        self.output_dir = output_dir
+        self.filename = filename
+        self.rate = rate
+        self.progress_callback = progress
+        self.cancel_event = cancel_event or threading.Event()
+        self.assets = assets
+        self.visible = visible
+        self.store = store
+        self.from_store = from_store
+        self.refresh = refresh
+        self.max_age = max_age
+        self.daily = daily
+        self.metrics_path = metrics_path
+        self.resume = resume
+        self.limiter = limiter  # Shared with other runs; without one the run gets its own
+
+        self.metrics = RunMetrics()
+        self.status = "pending"  # pending, running, done or failed
+        self.error = None
+        self.last_progress = None
+        self.all_data = None
+        self.region_data = {}
+        self.region_interest = None
+        self.missing_terms = []
+        self.stats = None
+        self.report_path = None
+        self.journal = None
+
+    def progress(self, event):
+        self.last_progress = event
+        if self.progress_callback is not None:
+            self.progress_callback(event)
+
+    # Function to run the comparison on the calling thread; returns the report path
+    def execute(self):
+        self.status = "running"
+        token = active_metrics.set(self.metrics)
+        self.metrics.reset()
+        try:
+            self._fetch()
+            with self.metrics.span("stats"):
+                self.stats = build_stats(self.search_terms, self.all_data, self.regions, self.region_data)
+
+            # Generate HTML output
+            self.progress({"stage": "report"})
+            with self.metrics.span("report"):
+                self.report_path = generate_html_output(self.all_data, self.search_terms, self.missing_terms,
+                                                        self.regions, self.region_data, self.region_interest,
+                                                        self.generate_map, self.output_dir, self.filename,
+                                                        self.assets, self.visible, self.metrics, self.stats)
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            raise
+        finally:
+            active_metrics.reset(token)
+
+        self.metrics.report()
+        if self.metrics_path:
+            self.metrics.write(self.metrics_path)
+
+        # The journal is only needed until a run has fetched everything, including the region interest
+        # that does not make a term missing
+        if self.journal is not None:
+            if self.journal.failed or self.cancel_event.is_set():
+                print(f"Some requests did not complete; resume the run to fetch only those ({self.journal.path}).")
+            else:
+                self.journal.close(remove=True)
+        self.status = "done"
+        return self.report_path
+
+    def _fetch(self):
+        if self.from_store:
+            # Only the snapshots of this timeframe, put on one scale through the anchor of the newest run
+            label = stored_timeframe(self.timeframe, self.daily)
+            anchor = self.anchor or stored_anchor(self.store, self.search_terms, label)
+            with self.metrics.span("load_store"):
+                self.all_data, self.region_data, self.region_interest, self.missing_terms = load_stored_comparison(
+                    self.store, self.search_terms, self.regions, anchor, label)
+            return
+        if self.refresh:
+            with self.metrics.span("refresh"):
+                self.all_data, self.region_data, self.region_interest, self.missing_terms = refresh_comparison(
+                    self.store, self.search_terms, self.regions, self.anchor, self.timeframe, self.max_age,
+                    self.rate, self.progress, self.cancel_event, self.daily, self.limiter)
             return
 
-        # Remove duplicates
-        search_terms = list(dict.fromkeys(search_terms))
-
-        pytrends = TrendReq(hl='en-US', tz=360)
-        all_data = pd.DataFrame()
-        retry_time = 60  # Initial retry time in seconds
-        max_retries = 5  # Maximum number of retries
-        missing_terms = []
-
-        # Fetch data for the first region (e.g., US)
-        region1_data = pd.DataFrame()
-        if region1:
-            for i in range(0, len(search_terms), 5):
-                group = search_terms[i:i+5]
-                for attempt in range(max_retries):
-                    try:
-                        pytrends.build_payload(group, cat=0, timeframe='today 12-m', geo=region1, gprop='')
-                        data = pytrends.interest_over_time()
-                        region1_data = pd.concat([region1_data, data[group]], axis=1)
-                        break  # Exit loop when successful
-                    except Exception as e:
-                        if "429" in str(e):
-                            print(f"Rate limit exceeded. Waiting for {retry_time} seconds before retrying...")
-                            time.sleep(retry_time)
-                            retry_time *= 2  # Exponentially increase the wait time
-                        else:
-                            print(f"Error with terms {group}: {str(e)}. Skipping these terms.")
-                            for term in group:
-                                missing_terms.append(term)
-                            break  # Skip the group and continue to the next one
-
-                time.sleep(2)  # Introduce a delay between requests to avoid hitting the rate limit
-
-        # Fetch data for the second region (e.g., GB)
-        region2_data = pd.DataFrame()
-        if region2:
-            for i in range(0, len(search_terms), 5):
-                group = search_terms[i:i+5]
-                for attempt in range(max_retries):
-                    try:
-                        pytrends.build_payload(group, cat=0, timeframe='today 12-m', geo=region2, gprop='')
-                        data = pytrends.interest_over_time()
-                        region2_data = pd.concat([region2_data, data[group]], axis=1)
-                        break  # Exit loop when successful
-                    except Exception as e:
-                        if "429" in str(e):
-                            print(f"Rate limit exceeded. Waiting for {retry_time} seconds before retrying...")
-                            time.sleep(retry_time)
-                            retry_time *= 2  # Exponentially increase the wait time
-                        else:
-                            print(f"Error with terms {group}: {str(e)}. Skipping these terms.")
-                            for term in group:
-                                missing_terms.append(term)
-                            break  # Skip the group and continue to the next one
-
-                time.sleep(2)  # Introduce a delay between requests to avoid hitting the rate limit
-
-        # Fetch global data for comparison
-        for i in range(0, len(search_terms), 5):
-            group = search_terms[i:i+5]
-            for attempt in range(max_retries):
-                try:
-                    pytrends.build_payload(group, cat=0, timeframe='today 12-m', geo='', gprop='')
-                    data = pytrends.interest_over_time()
-                    all_data = pd.concat([all_data, data[group]], axis=1)
-                    break  # Exit loop when successful
-                except Exception as e:
-                    if "429" in str(e):
-                        print(f"Rate limit exceeded. Waiting for {retry_time} seconds before retrying...")
-                        time.sleep(retry_time)
-                        retry_time *= 2  # Exponentially increase the wait time
-                    else:
-                        print(f"Error with terms {group}: {str(e)}. Skipping these terms.")
-                        for term in group:
-                            missing_terms.append(term)
-                        break  # Skip the group and continue to the next one
-
-            time.sleep(2)  # Introduce a delay between requests to avoid hitting the rate limit
-
-        all_data = all_data.loc[:, ~all_data.columns.duplicated()]
-
-        stats = []  # Initialize the stats variable
+        # Every fetch is journaled next to the report as it arrives, so a crashed or cancelled run can resume
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.journal = FetchJournal(journal_path(self.output_dir, self.filename), self.resume)
+        try:
+            with self.metrics.span("fetch"):
+                self.all_data, self.region_data, self.region_interest, self.missing_terms = fetch_comparison(
+                    self.search_terms, self.regions, self.anchor, self.timeframe, self.rate, self.progress,
+                    self.cancel_event, self.daily, self.journal, self.limiter)
+        finally:
+            self.journal.close()
+        if self.streaming:
+            self.search_terms = self.search_terms.terms
+        if self.store is not None and store_snapshots:
+            with self.metrics.span("save_store"):
+                save_comparison(self.store, self.all_data, self.region_data, self.region_interest,
+                                stored_timeframe(self.timeframe, self.daily))
+
+    # Function to get the outcome of the run as JSON-ready values: its state, terms, stats and timings
+    def result(self):
+        stats = None
+        if self.stats is not None:
+            # JSON has no NaN, so missing values become null
+            stats = self.stats.astype(object).where(self.stats.notna(), None).to_dict(orient="records")
+        return {
+            "status": self.status,
+            "error": self.error,
+            "progress": self.last_progress,
+            "cancelled": self.cancel_event.is_set(),
+            "terms": list(self.search_terms) if not isinstance(self.search_terms, TermStream) else None,
+            "regions": self.regions,
+            "timeframe": self.timeframe,
+            "missing_terms": self.missing_terms,
+            "report": self.report_path,
+            "stats": stats,
+            "metrics": self.metrics.summary() if self.status in ("done", "failed") else None,
+        }
 
-        for term in search_terms:
-            if term in all_data.columns:
-                try:
-                    year_avg, month_avg, week_avg, last_year_avg = calculate_averages(all_data, term)
-                    latest_value = all_data[term].iloc[-1]
-
-                    # Fetch averages for Region 1
-                    if region1 and term in region1_data.columns:
-                        region1_year_avg, region1_month_avg, region1_week_avg = get_selected_region_averages(region1_data, term)
-                    else:
-                        region1_year_avg = region1_month_avg = region1_week_avg = None
-
-                    # Fetch averages for Region 2
-                    if region2 and term in region2_data.columns:
-                        region2_year_avg, region2_month_avg, region2_week_avg = get_selected_region_averages(region2_data, term)
-                    else:
-                        region2_year_avg = region2_month_avg = region2_week_avg = None
-
-                    stats.append((term, latest_value, year_avg, month_avg, week_avg, last_year_avg, region1_year_avg, region1_month_avg, region1_week_avg, region2_year_avg, region2_month_avg, region2_week_avg))
-                except Exception as e:
-                    print(f"Error processing term '{term}': {str(e)}. Skipping this term.")
-                    missing_terms.append(term)
-
-        stats.sort(key=lambda x: x[1], reverse=True)
-
-        # Generate HTML output
-        generate_html_output(all_data, search_terms, missing_terms, region1, region1_data, region2, region2_data, generate_map)
-    
+# Function to fetch Google Trends data, compute the stats and write the HTML report; returns the report path
+def run_comparison(search_terms, regions=None, generate_map=False, anchor=None, timeframe='today 12-m',
+                   output_dir=".", filename=None, open_browser=False, rate=request_rate, progress=None,
+                   cancel_event=None, assets=report_assets, visible=visible_series, store=trends_store,
+                   from_store=False, refresh=False, max_age=refresh_max_age, daily=False, metrics_path=None,
+                   resume=False):
+    run = ComparisonRun(search_terms, regions, generate_map, anchor, timeframe, output_dir, filename, rate, progress,
+                        cancel_event, assets, visible, store, from_store, refresh, max_age, daily, metrics_path,
+                        resume)
+    report_path = run.execute()
+    if open_browser:
+        webbrowser.open(f"file://{os.path.abspath(report_path)}")
+    return report_path
+
+# Function to fetch and plot Google Trends data for the GUI; runs on a worker thread and
+# reports progress, the finished report and errors as events on the queue
+def plot_trends(search_terms, regions=None, generate_map=False, anchor=None, filename=None, events=None,
+                cancel_event=None, timeframe='today 12-m', daily=False, resume=False):
+    events = events or queue.Queue()
+    cancel_event = cancel_event or threading.Event()
+    try:
+        report_path = run_comparison(search_terms, regions, generate_map, anchor, timeframe, filename=filename,
+                                     progress=events.put, cancel_event=cancel_event, daily=daily, resume=resume)
+        events.put({"stage": "done", "report": report_path, "cancelled": cancel_event.is_set()})
     except Exception as e:
-        messagebox.showerror("Error", f"An error occurred: {str(e)}")
+        events.put({"stage": "error", "message": f"An error occurred: {str(e)}"})
+
+# Styles for the HTML report
+report_style = """<style>
+    body {
+        font-family: Arial, sans-serif;
+        margin: 20px;
+    }
+    h2 {
+        text-align: center;
+        margin-top: 40px;
+    }
+    .container {
+        max-width: 1000px;
+        margin: auto;
+    }
+    .graph-container {
+        margin-bottom: 40px;
+    }
+    table {
+        width: 100%;
+        border-collapse: collapse;
+    }
+    th {
+        cursor: pointer;
+        padding: 10px;
+        background-color: #f2f2f2;
+        border: 1px solid #ddd;
+    }
+    td {
+        padding: 8px;
+        border: 1px solid #ddd;
+    }
+    .run-metrics {
+        max-width: 1000px;
+        margin: 40px auto 0;
+        color: #666;
+        font-size: 12px;
+    }
+</style>
+"""
+
+# Function to pick the points that keep the shape of each column (largest triangle three buckets, LTTB);
+# every column is downsampled at once and the chosen row positions are returned per column
+def lttb_indices(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.repeat(np.arange(n)[:, None], y.shape[1], axis=1)
+
+    columns = np.arange(y.shape[1])
+    selected = np.empty((threshold, y.shape[1]), dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    every = (n - 2) / (threshold - 2)
+    previous = np.zeros(y.shape[1], dtype=np.int64)
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        # The average of the next bucket is the third corner of the triangle
+        next_end = min(int((i + 2) * every) + 1, n)
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean(axis=0)
+
+        previous_x = x[previous]
+        previous_y = y[previous, columns]
+        area = np.abs((previous_x - next_x) * (y[start:end] - previous_y)
+                      - (previous_x - x[start:end, None]) * (next_y - previous_y))
+        previous = start + area.argmax(axis=0)
+        selected[i + 1] = previous
+    return selected
+
+# Function to downsample every series to at most max_points; returns (term, x, y) per series.
+# Series with gaps are downsampled on their own so the gaps don't count as points
+def downsample_series(data, terms, max_points=max_points_per_series):
+    if not max_points or len(data) <= max_points:
+        return [(term, data.index, data[term].to_numpy()) for term in terms]
+
+    x = data.index.asi8.astype(float) if isinstance(data.index, pd.DatetimeIndex) else np.arange(len(data), dtype=float)
+    values = data[terms].to_numpy(dtype=float)
+    complete = ~np.isnan(values).any(axis=0)
+
+    series = {}
+    if complete.any():
+        indices = lttb_indices(x, values[:, complete], max_points)
+        for i, term in enumerate(np.array(terms, dtype=object)[complete]):
+            series[term] = (data.index[indices[:, i]], values[indices[:, i], np.flatnonzero(complete)[i]])
+    for i in np.flatnonzero(~complete):
+        rows = np.flatnonzero(~np.isnan(values[:, i]))
+        indices = rows[lttb_indices(x[rows], values[rows, i:i+1], max_points)[:, 0]]
+        series[terms[i]] = (data.index[indices], values[indices, i])
+    return [(term, *series[term]) for term in terms]
+
+# Function to build the comparison chart; past webgl_trace_threshold series it switches to WebGL lines
+# without markers, and with visible set only the top terms of the ranking are shown at first
+def build_trend_figure(data, terms, title, ranking=None, visible=visible_series, max_points=max_points_per_series):
+    import plotly.graph_objs as go
+
+    terms = [term for term in terms if term in data.columns]
+    use_webgl = len(terms) > webgl_trace_threshold
+    shown = set((ranking if ranking is not None else terms)[:visible]) if visible else set(terms)
+
+    # Dates go out as epoch milliseconds and values as float32, which plotly writes as compact binary arrays
+    # instead of one string per point
+    hover = dict(
+        hoverinfo='name+y',
+        hoverlabel=dict(
+            bgcolor="white",
+            font_size=12,
+            font_family="Arial",
+            bordercolor="black"
+        ),
+        hovertemplate="<b>%{y}</b><extra>%{fullData.name}</extra>"
+    )
+    traces = []
+    for term, x, y in downsample_series(data, terms, max_points):
+        if isinstance(x, pd.DatetimeIndex):
+            x = x.as_unit("ms").asi8.astype(float)
+        y = np.asarray(y, dtype=np.float32)
+        state = True if term in shown else 'legendonly'
+        if use_webgl:
+            trace = go.Scattergl(x=x, y=y, mode='lines', name=term, visible=state, line=dict(width=1.5), **hover)
+        else:
+            trace = go.Scatter(x=x, y=y, mode='lines+markers', name=term, visible=state,
+                               marker=dict(size=8), line=dict(width=2), **hover)
+        traces.append(trace)
+    fig = go.Figure(data=traces)
 
-# Function to generate HTML output
-def generate_html_output(data, search_terms, missing_terms, region1, region1_data, region2, region2_data, generate_map):
-    try:
-        # Generate the main graph
-        fig = go.Figure()
+    fig.update_layout(
+        title=title,
+        xaxis_title='Date',
+        xaxis_type='date' if isinstance(data.index, pd.DatetimeIndex) else None,
+        yaxis_title='Search Interest',
+        # A unified hover box listing hundreds of series is unreadable and slow to draw
+        hovermode='closest' if use_webgl else 'x unified',
+        margin=dict(l=40, r=40, t=40, b=40),
+        autosize=True,
+        showlegend=True,
+        hoverlabel=dict(
+            bgcolor='white',
+            bordercolor='black',
+            font_size=12,
+            namelength=0
+        ),
+        dragmode=False,
+    )
+    return fig
+
+# Function to build the cluster figures: a heatmap of the correlations between the terms, ordered by cluster,
+# and a chart per cluster of its most typical terms and its average
+def build_cluster_figures(data, stats, max_terms=heatmap_max_terms, chart_terms=cluster_chart_terms):
+    import plotly.graph_objs as go
+
+    clustered = stats.dropna(subset=["cluster"]).sort_values(["cluster", "cluster_fit"], ascending=[True, False],
+                                                             kind="stable")
+    if clustered.empty:
+        return []
+
+    # Past max_terms the heatmap keeps the most typical terms of every cluster, in proportion to its size
+    shown = clustered
+    if len(clustered) > max_terms:
+        position = clustered.groupby("cluster").cumcount()
+        sizes = clustered.groupby("cluster")["term"].transform("size")
+        shown = clustered[position < np.maximum(1, np.floor(sizes * max_terms / len(clustered)))]
+    terms = list(shown["term"])
+    shapes = trend_shapes(data[terms])
+    heatmap = go.Figure(go.Heatmap(
+        z=shapes.T @ shapes, x=terms, y=terms, zmin=-1, zmax=1, colorscale="RdBu", reversescale=True,
+        hovertemplate="%{y}<br>%{x}<br>Correlation: %{z:.2f}<extra></extra>",
+    ))
+    title = "Trend Correlation by Cluster"
+    if len(terms) < len(clustered):
+        title += f" ({len(terms)} most typical of {len(clustered)} terms)"
+    heatmap.update_layout(
+        title=title,
+        height=700,
+        xaxis=dict(showticklabels=len(terms) <= 50),
+        yaxis=dict(showticklabels=len(terms) <= 50, autorange="reversed"),
+        margin=dict(l=40, r=40, t=40, b=40),
+    )
 
+    figures = [heatmap]
+    for cluster, members in clustered.groupby("cluster", sort=True):
+        members = list(members["term"])
+        frame = data[members[:chart_terms]].copy()
+        frame["Cluster average"] = data[members].mean(axis=1)
+        fig = build_trend_figure(frame, list(frame.columns),
+                                 f"Cluster {int(cluster)}: {len(members)} terms like {members[0]}")
+        fig.data[-1].update(mode="lines", line=dict(color="black", dash="dash", width=3))
+        fig.update_layout(height=400)
+        figures.append(fig)
+    return figures
+
+# Function to render the clusters section of the report; plotly.js is already loaded by the main graph
+def cluster_section_html(data, stats):
+    import plotly.io as pio
+
+    figures = build_cluster_figures(data, stats)
+    if not figures:
+        return ""
+    charts = "".join(f"""
+        <div class="graph">
+{pio.to_html(fig, full_html=False, include_plotlyjs=False)}
+        </div>""" for fig in figures)
+    return f"""
+    <h2>Clusters</h2>
+    <div class="graph-container">{charts}
+    </div>
+"""
+
+# Function to generate HTML output
+def generate_html_output(data, search_terms, missing_terms, regions, region_data, region_interest, generate_map,
+                         output_dir=".", filename=None, assets=report_assets, visible=visible_series, metrics=None,
+                         stats=None):
+    import plotly.io as pio
+
+    if stats is None:
+        stats = build_stats(search_terms, data, regions, region_data)
+
+    # Generate the main graph
+    with current_metrics().span("report.figure"):
+        fig = build_trend_figure(data, search_terms, 'Google Trends Comparison', list(stats["term"]), visible)
+
+    if not filename:
+        filename = "google_trends_comparison.html"
+    os.makedirs(output_dir, exist_ok=True)
+    report_path = os.path.join(output_dir, filename)
+
+    # In shared mode plotly.js and the maps are separate files next to the report and each map is only
+    # loaded when its term is picked; in inline mode the report is a single self-contained page
+    map_files = None
+    with current_metrics().span("report.plotly_html"):
+        plotlyjs = write_plotly_asset(output_dir) if assets == "shared" else True
+        graph_html = pio.to_html(fig, full_html=False, include_plotlyjs=plotlyjs)
+    if assets == "shared" and generate_map:
+        with current_metrics().span("report.maps"):
+            map_files = write_map_assets(region_interest, search_terms, output_dir,
+                                         f"{os.path.splitext(filename)[0]}_maps")
+    with current_metrics().span("report.clusters"):
+        cluster_html = cluster_section_html(data, stats)
+
+    # Save the initial HTML with the highest average term's map
+    with current_metrics().span("report.write"):
+        write_report(report_path, html_report_chunks(graph_html, stats, search_terms, missing_terms, regions,
+                                                     region_interest, generate_map, map_files,
+                                                     report_payload_chunks(data, region_data, region_interest),
+                                                     cluster_html=cluster_html, metrics=metrics))
+
+    return report_path
+
+# Function to write a report to disk chunk by chunk, so the whole document never has to be held in memory;
+# returns the size in bytes. Chunks are encoded here so the count is in bytes, not characters
+def write_report(path, chunks):
+    bytes_written = 0
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            bytes_written += f.write(chunk.encode("utf-8"))
+    current_metrics().add("bytes_written", bytes_written)
+    return bytes_written
+
+# Function to describe the stats table columns: the data key, whether it is text or a number,
+# and which value a number is compared against for its colour and arrow
+def stats_table_columns(regions):
+    columns = [
+        {"label": "Term", "key": "term", "type": "str"},
+        {"label": "Latest Value", "key": "latest", "type": "num", "compare": "year_avg"},
+        {"label": "Year Avg", "key": "year_avg", "type": "num", "compare": "last_year_avg"},
+        {"label": "Month Avg", "key": "month_avg", "type": "num", "compare": "year_avg"},
+        {"label": "Week Avg", "key": "week_avg", "type": "num", "compare": "month_avg"},
+    ]
+    for region in regions:
+        for period, label in (("year_avg", "Year Avg"), ("month_avg", "Month Avg"), ("week_avg", "Week Avg")):
+            columns.append({"label": f"{region} {label}", "key": f"{region}_{period}", "type": "num", "compare": period})
+    columns += [
+        {"label": "Trend /Week", "key": "slope", "type": "num"},
+        {"label": "YoY Growth %", "key": "yoy_growth", "type": "num"},
+        {"label": "Seasonality", "key": "seasonality", "type": "num"},
+        {"label": "Latest z-Score", "key": "latest_z", "type": "num"},
+        {"label": "Anomalies", "key": "anomalies", "type": "num"},
+        {"label": "Peaks", "key": "peaks", "type": "num"},
+        {"label": "Peak Date", "key": "peak_date", "type": "str"},
+        {"label": "Cluster", "key": "cluster", "type": "num"},
+        {"label": "Most Similar", "key": "most_similar", "type": "str"},
+        {"label": "Similarity", "key": "similarity", "type": "num"},
+        {"label": "Top Region", "key": "top_region", "type": "str"},
+        {"label": "Top Region Year Avg", "key": "top_region_year_avg", "type": "num", "compare": "year_avg"},
+    ]
+    return columns
+
+# Function to embed JSON inside a <script> element without ending the element early
+def script_json(value):
+    return json.dumps(value, separators=(",", ":")).replace("</", "<\\/")
+
+# Function to write a frame as JSON chunks: its index and the values of each column, with gaps as null
+def frame_json_chunks(frame):
+    yield '{"index":' + script_json(list(frame.index.astype(str))) + ',"columns":{'
+    values = frame.to_numpy(dtype=float)
+    for i, column in enumerate(frame.columns):
+        column_values = [None if math.isnan(value) else value for value in values[:, i].tolist()]
+        yield ("," if i else "") + script_json(str(column)) + ":" + script_json(column_values)
+    yield "}}"
+
+# Function to write the data behind a report as an embedded JSON payload: the series of every term
+# globally and per region and the worldwide region interest. Merging reads this instead of the HTML
+def report_payload_chunks(data, region_data, region_interest):
+    yield f'<script type="application/json" id="{report_payload_id}">'
+    yield from report_data_chunks(data, region_data, region_interest)
+    yield "</script>\n"
+
+# Function to generate the JSON document with the data of a comparison piece by piece
+def report_data_chunks(data, region_data, region_interest):
+    yield '{"version":1,"global":'
+    yield from frame_json_chunks(data)
+    yield ',"regions":{'
+    for i, (region, frame) in enumerate(region_data.items()):
+        yield ("," if i else "") + script_json(region) + ":"
+        yield from frame_json_chunks(frame)
+    yield '},"region_interest":'
+    yield from frame_json_chunks(region_interest)
+    yield "}"
+
+# Function to generate the report HTML piece by piece: header, graph, one chunk per table row, then the scripts;
+# without map_files the maps are embedded in the page
+def html_report_chunks(graph_html, stats, search_terms, missing_terms, regions, region_interest, generate_map,
+                       map_files=None, payload=(), title="Google Trends Comparison", cluster_html="", metrics=None):
+    yield f"""
+<html>
+<head>
+<title>{title}</title>
+"""
+    yield report_style
+    yield """</head>
+<body>
+"""
+    # The data payload comes first, so merging only has to read the start of the file
+    yield from payload
+    yield """<div class="container">
+"""
+
+    # Terms can come from anyone using the report service, so they are always escaped in the page
+    if missing_terms:
+        yield f"""
+    <div style="border: 2px solid red; color: red; padding: 10px; margin-bottom: 20px;">
+        <strong>These terms encountered issues or were not found in the data:</strong>
+        {html.escape(', '.join(missing_terms))}
+    </div>
+"""
+
+    yield """
+    <div class="graph-container">
+"""
+    # Add dropdown for selecting terms and showing the corresponding map if generate_map is True
+    if generate_map and not stats.empty:
+        yield f"""
+        <div>
+            <h2>Worldwide Search Interest for <span id="selectedTerm">{html.escape(stats["term"].iloc[0])}</span></h2>
+            <select id="termDropdown" onchange="changeMap(this.value)">
+"""
         for term in search_terms:
-            if term in data.columns:
-                fig.add_trace(go.Scatter(x=data.index, y=data[term], mode='lines+markers', name=term,
-                                         hoverinfo='name+y',
-                                         marker=dict(size=8),
-                                         line=dict(width=2)))
-
-        fig.update_layout(
-            title='Google Trends Comparison',
-            xaxis_title='Date',
-            yaxis_title='Search Interest',
-            hovermode='x unified',
-            margin=dict(l=40, r=40, t=40, b=40),
-            autosize=True,
-            showlegend=True,
-            hoverlabel=dict(
-                bgcolor='white',
-                bordercolor='black',
-                font_size=12,
-                namelength=0
-            ),
-            dragmode=False,
-        )
-
-        fig.update_traces(
-            hoverlabel=dict(
-                bgcolor="white",
-                font_size=12,
-                font_family="Arial",
-                bordercolor="black"
-            ),
-            hovertemplate="<b>%{y}</b><extra>%{fullData.name}</extra>"
-        )
-
-        graph_html = pio.to_html(fig, full_html=False)
-
-        missing_terms_html = ""
-        if missing_terms:
-            missing_terms_html = f"""
-            <div style="border: 2px solid red; color: red; padding: 10px; margin-bottom: 20px;">
-                <strong>These terms encountered issues or were not found in the data:</strong> {', '.join(missing_terms)}
-            </div>
-            """
-
-        total_pages = math.ceil(len(stats) / items_per_page)
-        pagination_html = f"""
-        <div style="text-align: center; margin-top: 20px;">
-            <button onclick="prevPage()" style="padding: 10px; font-size: 16px;">Previous</button>
-            <span id="pageInfo">Page 1 of {total_pages}</span>
-            <button onclick="nextPage()" style="padding: 10px; font-size: 16px;">Next</button>
+            selected = " selected" if term == stats["term"].iloc[0] else ""
+            value = html.escape(term, quote=True)
+            yield f'                <option value="{value}"{selected}>{html.escape(term)}</option>\n'
+        yield """            </select>
+            <div id="worldMap"></div>
         </div>
-        """
-
-        # Header with updated column layout
-        stats_html = f"""
-        <table id="statsTable" style="width: 100%; border-collapse: collapse;">
-        <thead>
-            <tr>
-                <th onclick="sortTable(0, 'str')">Term <span></span></th>
-                <th onclick="sortTable(1, 'num')">Latest Value <span></span></th>
-                <th onclick="sortTable(2, 'num')">Year Avg <span></span></th>
-                <th onclick="sortTable(3, 'num')">Month Avg <span></span></th>
-                <th onclick="sortTable(4, 'num')">Week Avg <span></span></th>
-                <th onclick="sortTable(5, 'num')">{region1} Year Avg <span></span></th>
-                <th onclick="sortTable(6, 'num')">{region1} Month Avg <span></span></th>
-                <th onclick="sortTable(7, 'num')">{region1} Week Avg <span></span></th>
-                <th onclick="sortTable(8, 'str')">Top Region <span></span></th>
-                <th onclick="sortTable(9, 'num')">Top Region Year Avg <span></span></th>
-                <th onclick="sortTable(10, 'num')">Top Region Month Avg <span></span></th>
-                <th onclick="sortTable(11, 'num')">Top Region Week Avg <span></span></th>
-            </tr>
-        </thead>
-        <tbody id="statsTableBody">
-        """
-
-        for i, stat in enumerate(stats):
-            latest_color, latest_arrow = compare_values(stat[1], stat[2])
-            year_color, year_arrow = compare_values(stat[2], stat[5])
-            month_color, month_arrow = compare_values(stat[3], stat[2])
-            week_color, week_arrow = compare_values(stat[4], stat[3])
-
-            stats_html += f"""
-            <tr data-index="{i + 1}">
-                <td style="padding: 8px;">{stat[0]}</td>
-                <td style="padding: 8px; color: {latest_color};">{stat[1]:.2f} {latest_arrow}</td>
-                <td style="padding: 8px; color: {year_color};">{stat[2]:.2f} {year_arrow}</td>
-                <td style="padding: 8px; color: {month_color};">{stat[3]:.2f} {month_arrow}</td>
-                <td style="padding: 8px; color: {week_color};">{stat[4]:.2f} {week_arrow}</td>
-            """
-
-            if region1_data is not None and not region1_data.empty:
-                selected_region1_year_avg, selected_region1_month_avg, selected_region1_week_avg = get_selected_region_averages(region1_data, stat[0])
-                selected1_year_color, selected1_year_arrow = compare_values(selected_region1_year_avg, stat[2])
-                selected1_month_color, selected1_month_arrow = compare_values(selected_region1_month_avg, stat[3])
-                selected1_week_color, selected1_week_arrow = compare_values(selected_region1_week_avg, stat[4])
-
-                stats_html += f"""
-                    <td style="padding: 8px; color: {selected1_year_color};">{selected_region1_year_avg:.2f} {selected1_year_arrow}</td>
-                    <td style="padding: 8px; color: {selected1_month_color};">{selected_region1_month_avg:.2f} {selected1_month_arrow}</td>
-                    <td style="padding: 8px; color: {selected1_week_color};">{selected_region1_week_avg:.2f} {selected1_week_arrow}</td>
-                """
-
-            top_region_name, top_region_year_avg, top_region_month_avg, top_region_week_avg = get_top_region_comparison_data(stat[0])
-            top_region_year_color, top_region_year_arrow = compare_values(top_region_year_avg, stat[2])
-            top_region_month_color, top_region_month_arrow = compare_values(top_region_month_avg, stat[3])
-            top_region_week_color, top_region_week_arrow = compare_values(top_region_week_avg, stat[4])
-
-            # Ensure proper encoding of region names
-            top_region_name = top_region_name.encode('latin1').decode('latin1')
-
-            stats_html += f"""
-                <td style="padding: 8px;">{top_region_name}</td>
-                <td style="padding: 8px; color: {top_region_year_color};">{top_region_year_avg:.2f} {top_region_year_arrow}</td>
-                <td style="padding: 8px; color: {top_region_month_color};">{top_region_month_avg:.2f} {top_region_month_arrow}</td>
-                <td style="padding: 8px; color: {top_region_week_color};">{top_region_week_avg:.2f} {top_region_week_arrow}</td>
-            </tr>
-            """
-
-        stats_html += """
-        </tbody>
-        </table>
-        <script>
-        let currentPage = 1;
-        const itemsPerPage = """ + str(items_per_page) + """;
-        const totalItems = """ + str(len(stats)) + """;
-        const totalPages = """ + str(total_pages) + """;
-
-        function renderTablePage(page) {
-            const rows = document.querySelectorAll('#statsTableBody tr');
-            rows.forEach(row => {
-                const rowIndex = parseInt(row.getAttribute('data-index'));
-                if (rowIndex > (page - 1) * itemsPerPage && rowIndex <= page * itemsPerPage) {
-                    row.style.display = '';
-                } else {
-                    row.style.display = 'none';
-                }
-            });
-            document.getElementById('pageInfo').textContent = `Page ${page} of ${totalPages}`;
+"""
+    yield """        <div class="graph">
+"""
+    yield graph_html
+    yield """
+        </div>
+    </div>
+"""
+    yield cluster_html
+
+    if generate_map and not stats.empty:
+        yield f"""
+<script>
+    // Maps are registered by term, either embedded below or from a small script
+    // that is loaded the first time its term is picked
+    const mapFiles = {script_json(map_files or {})};
+    const mapTemplate = {map_template_json()};
+    const mapFigures = {{}};
+
+    function registerMap(term, figure) {{
+        figure.layout.template = mapTemplate;
+        mapFigures[term] = figure;
+    }}
+
+    function changeMap(term) {{
+        document.getElementById('selectedTerm').textContent = term;
+        const mapDiv = document.getElementById('worldMap');
+        const figure = mapFigures[term];
+        if (figure) {{
+            if (!mapDiv.classList.contains('js-plotly-plot')) mapDiv.textContent = '';
+            Plotly.react(mapDiv, figure.data, figure.layout);
+        }} else if (mapFiles[term]) {{
+            const script = document.createElement('script');
+            script.src = mapFiles[term];
+            delete mapFiles[term];
+            // Only draw it if the term is still the one picked once the script has loaded
+            script.onload = script.onerror = () => {{
+                if (document.getElementById('termDropdown').value === term) changeMap(term);
+            }};
+            document.head.appendChild(script);
+        }} else {{
+            Plotly.purge(mapDiv);
+            mapDiv.textContent = 'No map data for this term.';
+        }}
+    }}
+</script>
+"""
+        if map_files is None:
+            for term, figure_json in render_map_figures(region_interest, search_terms).items():
+                if figure_json:
+                    figure_json = figure_json.replace("</", "<\\/")
+                    yield f"<script>registerMap({script_json(term)}, {figure_json});</script>\n"
+        yield """<script>
+    changeMap(document.getElementById('termDropdown').value);
+</script>
+"""
+
+    # The stats are embedded as a compact JSON array and only the visible page is rendered from it
+    columns = stats_table_columns(regions)
+    keys = [column["key"] for column in columns]
+    keys += [column["compare"] for column in columns if column.get("compare") and column["compare"] not in keys]
+    for column in columns:
+        column["index"] = keys.index(column["key"])
+        column["compareIndex"] = keys.index(column["compare"]) if column.get("compare") else None
+
+    header_cells = "".join(
+        f"""
+            <th onclick="sortTable({i}, '{column['type']}')">{html.escape(column['label'])} <span></span></th>"""
+        for i, column in enumerate(columns))
+    total_pages = max(1, math.ceil(len(stats) / items_per_page))
+
+    yield f"""
+    <h2>Stats</h2>
+    <div>
+    <table id="statsTable" style="width: 100%; border-collapse: collapse;">
+    <thead>
+        <tr>{header_cells}
+        </tr>
+    </thead>
+    <tbody id="statsTableBody"></tbody>
+    </table>
+    </div>
+    <div style="text-align: center; margin-top: 20px;">
+        <button onclick="prevPage()" style="padding: 10px; font-size: 16px;">Previous</button>
+        <span id="pageInfo">Page 1 of {total_pages}</span>
+        <button onclick="nextPage()" style="padding: 10px; font-size: 16px;">Next</button>
+    </div>
+</div>
+<script type="application/json" id="statsColumns">{script_json(columns)}</script>
+<script type="application/json" id="statsData">["""
+
+    with current_metrics().span("report.top_regions"):
+        top_regions = get_top_region_comparison_data(region_interest)
+    rows = stats.join(top_regions, on="term")
+    rows[top_regions.columns] = rows[top_regions.columns].fillna({"top_region": "N/A"}).fillna(0)
+    text_keys = {column["key"] for column in columns if column["type"] == "str"}
+    numeric_keys = [key for key in keys if key not in text_keys]
+    rows[numeric_keys] = rows[numeric_keys].astype(float).round(2)
+    for i, row in enumerate(rows[keys].itertuples(index=False, name=None)):
+        # JSON has no NaN, so missing values become null
+        row = [None if isinstance(value, float) and math.isnan(value) else value for value in row]
+        yield ("," if i else "") + script_json(row)
+
+    yield """]</script>
+<script>
+    const statsColumns = JSON.parse(document.getElementById('statsColumns').textContent);
+    const statsRows = JSON.parse(document.getElementById('statsData').textContent);
+    const itemsPerPage = """ + str(items_per_page) + """;
+    const totalPages = Math.max(1, Math.ceil(statsRows.length / itemsPerPage));
+    const collator = new Intl.Collator(undefined, {sensitivity: 'base', numeric: true});
+    let currentPage = 1;
+    let sortColumn = null;
+    let sortDir = 'asc';
+
+    function renderCell(row, column) {
+        const cell = document.createElement('td');
+        const value = row[column.index];
+        cell.style.padding = '8px';
+        if (column.type === 'str') {
+            cell.textContent = value;
+            return cell;
         }
-
-        function nextPage() {
-            if (currentPage < totalPages) {
-                currentPage++;
-                renderTablePage(currentPage);
-            }
+        if (value === null) {
+            cell.textContent = 'N/A';
+            return cell;
         }
-
-        function prevPage() {
-            if (currentPage > 1) {
-                currentPage--;
-                renderTablePage(currentPage);
+        let arrow = '';
+        if (column.compareIndex !== null && row[column.compareIndex] !== null) {
+            const other = row[column.compareIndex];
+            if (value > other) {
+                cell.style.color = 'green';
+                arrow = ' \u25B2';
+            } else if (value < other) {
+                cell.style.color = 'red';
+                arrow = ' \u25BC';
             }
         }
-
-        function sortTable(n, type) {
-            let table, rows, switching, i, x, y, shouldSwitch, dir, switchcount = 0;
-            table = document.getElementById("statsTable");
-            switching = true;
-            dir = "asc";
-
-            // Remove all arrow indicators
-            document.querySelectorAll('th span').forEach(span => span.textContent = '');
-
-            while (switching) {
-                switching = false;
-                rows = table.rows;
-                for (i = 1; i < (rows.length - 1); i++) {
-                    shouldSwitch = false;
-                    x = rows[i].getElementsByTagName("TD")[n];
-                    y = rows[i + 1].getElementsByTagName("TD")[n];
-
-                    if (type === 'num') {
-                        if ((dir == "asc" && parseFloat(x.innerHTML) > parseFloat(y.innerHTML)) || 
-                            (dir == "desc" && parseFloat(x.innerHTML) < parseFloat(y.innerHTML))) {
-                            shouldSwitch = true;
-                            break;
-                        }
-                    } else if (type === 'str') {
-                        if ((dir == "asc" && x.innerHTML.toLowerCase() > y.innerHTML.toLowerCase()) || 
-                            (dir == "desc" && x.innerHTML.toLowerCase() < y.innerHTML.toLowerCase())) {
-                            shouldSwitch = true;
-                            break;
-                        }
-                    }
-                }
-                if (shouldSwitch) {
-                    rows[i].parentNode.insertBefore(rows[i + 1], rows[i]);
-                    switching = true;
-                    switchcount++;
-                } else {
-                    if (switchcount == 0 && dir == "asc") {
-                        dir = "desc";
-                        switching = true;
-                    }
-                }
+        cell.textContent = value.toFixed(2) + arrow;
+        return cell;
+    }
+
+    // Only the rows of the current page exist in the DOM
+    function renderTablePage(page) {
+        const fragment = document.createDocumentFragment();
+        const start = (page - 1) * itemsPerPage;
+        for (const row of statsRows.slice(start, start + itemsPerPage)) {
+            const tr = document.createElement('tr');
+            for (const column of statsColumns) {
+                tr.appendChild(renderCell(row, column));
             }
+            fragment.appendChild(tr);
+        }
+        document.getElementById('statsTableBody').replaceChildren(fragment);
+        document.getElementById('pageInfo').textContent = `Page ${page} of ${totalPages}`;
+    }
 
-            // Add arrow indicators after sorting
-            const arrowSymbol = dir == "asc" ? "&#x25BC;" : "&#x25B2;";
-            document.querySelectorAll("th span")[n].innerHTML = arrowSymbol;
+    function nextPage() {
+        if (currentPage < totalPages) {
+            currentPage++;
+            renderTablePage(currentPage);
+        }
+    }
 
+    function prevPage() {
+        if (currentPage > 1) {
+            currentPage--;
             renderTablePage(currentPage);
         }
+    }
+
+    // Sorts the data array itself; clicking the same column again reverses the order
+    function sortTable(n, type) {
+        const column = statsColumns[n];
+        sortDir = (sortColumn === n && sortDir === 'asc') ? 'desc' : 'asc';
+        sortColumn = n;
+        const direction = sortDir === 'asc' ? 1 : -1;
+        const i = column.index;
+
+        if (type === 'num') {
+            statsRows.sort((a, b) => {
+                if (a[i] === null) return b[i] === null ? 0 : 1;
+                if (b[i] === null) return -1;
+                return direction * (a[i] - b[i]);
+            });
+        } else {
+            statsRows.sort((a, b) => direction * collator.compare(String(a[i]), String(b[i])));
+        }
+
+        // Add arrow indicators after sorting
+        document.querySelectorAll('#statsTable th span').forEach(span => span.textContent = '');
+        document.querySelectorAll('#statsTable th span')[n].innerHTML = sortDir === 'asc' ? '&#x25BC;' : '&#x25B2;';
 
         renderTablePage(currentPage);
-        </script>
-        """
-
-        # Add dropdown for selecting terms and showing the corresponding map if generate_map is True
-        dropdown_html = ""
-        if generate_map:
-            dropdown_html = f"""
-            <div>
-                <h2>Worldwide Search Interest for <span id="selectedTerm">{stats[0][0]}</span></h2>
-                <select id="termDropdown" onchange="changeMap(this.value)">
-                    {''.join([f'<option value="{term}">{term}</option>' for term in search_terms])}
-                </select>
-            </div>
-            """
-
-        full_html = f"""
-        <html>
-        <head>
-        <title>Google Trends Comparison</title>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                margin: 20px;
-            }}
-            h2 {{
-                text-align: center;
-                margin-top: 40px;
-            }}
-            .container {{
-                max-width: 1000px;
-                margin: auto;
-            }}
-            .graph-container {{
-                margin-bottom: 40px;
-            }}
-            table {{
-                width: 100%;
-                border-collapse: collapse;
-            }}
-            th {{
-                cursor: pointer;
-                padding: 10px;
-                background-color: #f2f2f2;
-                border: 1px solid #ddd;
-            }}
-            td {{
-                padding: 8px;
-                border: 1px solid #ddd;
-            }}
-        </style>
-        </head>
-        <body>
-        <div class="container">
-            {missing_terms_html}
-            <div class="graph-container">
-                {dropdown_html}
-                <div class="graph">
-                    {graph_html}
-                </div>
-            </div>
-            <h2>Stats</h2>
-            <div>
-                {stats_html}
-            </div>
-            {pagination_html}
-        </div>
-        </body>
-        </html>
-        """
-
-        # Save the initial HTML with the highest average term's map
-        filename = filename_entry.get()
-        if not filename:
-            filename = "google_trends_comparison.html"
-
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(full_html)
-
-        if generate_map:
-            # Save individual HTML files for each term's map
-            for term in search_terms:
-                term_map_html = generate_worldwide_map(data, search_terms, term)
-                with open(f"{term}_map.html", "w", encoding="utf-8") as f:
-                    f.write(term_map_html)
-
-        webbrowser.open(f"file://{os.path.abspath(filename)}")
-    
-    except Exception as e:
-        messagebox.showerror("Error", f"An error occurred while generating the HTML output: {str(e)}")
+    }
+
+    renderTablePage(currentPage);
+</script>
+"""
+    # The footer is rendered last so it covers as much of the run as possible
+    if metrics is not None:
+        yield metrics.footer_html()
+    yield """
+</body>
+</html>
+"""
 
 
-# Function to generate the worldwide map
-def generate_worldwide_map(data, search_terms, term):
+# Function to generate the worldwide map; returns the figure as JSON without its template, since
+# the report holds one copy of the template for every map
+def generate_worldwide_map(region_interest, term):
+    import plotly.express as px
+
     try:
-        pytrends = TrendReq(hl='en-US', tz=360)
-        pytrends.build_payload([term], cat=0, timeframe='today 12-m', geo='')
-        df = pytrends.interest_by_region(resolution='COUNTRY', inc_low_vol=True)
-        df = df.reset_index()
+        if term not in region_interest.columns:
+            return ""
+        df = region_interest[[term]].reset_index()
 
         fig = px.choropleth(df, locations='geoName', locationmode='country names', color=term,
                             title=f'Worldwide Search Interest for {term}',
                             color_continuous_scale='Viridis')
 
-        fig.update_layout(geo=dict(showcoastlines=True, coastlinecolor="Black"))
+        fig.update_layout(geo=dict(showcoastlines=True, coastlinecolor="Black"), template=None)
 
-        return pio.to_html(fig, full_html=False)
+        return fig.to_json(validate=False)
     except Exception as e:
         print(f"Error generating worldwide map: {str(e)}")
         return ""
 
-# Function to calculate averages for selected regions
-def get_selected_region_averages(region_data, term):
-    if region_data.empty or term not in region_data.columns:
-        return 0, 0, 0
-    year_avg = region_data[term].mean()
-    month_avg = region_data[term].tail(30).mean()  # Approximate month average (last 30 days)
-    week_avg = region_data[term].tail(7).mean()  # Approximate week average (last 7 days)
-    return year_avg, month_avg, week_avg
-
-# Function to get comparison data for the top region
-def get_top_region_comparison_data(term):
+# Function to render the maps of a list of terms; runs in a render worker process
+def render_map_chunk(region_interest, terms):
+    return [generate_worldwide_map(region_interest, term) for term in terms]
+
+# Function to render the map of every term, across a pool of processes for long term lists. Every worker only
+# gets the region interest of its own terms, and the figures come back in term order, so the output is the
+# same as rendering them one by one
+def render_map_figures(region_interest, terms, workers=render_workers):
+    terms = list(terms)
+    workers = min(workers or os.cpu_count() or 1, len(terms))
+    if workers <= 1 or len(terms) < parallel_render_min_terms:
+        return dict(zip(terms, render_map_chunk(region_interest, terms)))
+
+    # A few chunks per worker keeps them all busy when some maps take longer than others
+    size = math.ceil(len(terms) / (workers * 4))
+    chunks = [terms[i:i + size] for i in range(0, len(terms), size)]
+    parts = [region_interest[[term for term in chunk if term in region_interest.columns]] for chunk in chunks]
     try:
-        pytrends = TrendReq(hl='en-US', tz=360)
-        pytrends.build_payload([term], cat=0, timeframe='today 12-m', geo='')
-        df = pytrends.interest_by_region(resolution='COUNTRY', inc_low_vol=True)
-        if df.empty:
-            return "N/A", 0, 0, 0
-        top_region_name = df[term].idxmax()
-        top_region_year_avg = df[term].mean()
-        top_region_month_avg = df[term].tail(30).mean()
-        top_region_week_avg = df[term].tail(7).mean()
-        return top_region_name, top_region_year_avg, top_region_month_avg, top_region_week_avg
-    except Exception as e:
-        return "N/A", 0, 0, 0
+        # Workers are spawned rather than forked: forking a process that runs other threads (fetch workers,
+        # the service) can copy a lock another thread holds, and the child then waits on it forever
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            figures = [figure for rendered in executor.map(render_map_chunk, parts, chunks) for figure in rendered]
+    except (OSError, BrokenProcessPool) as e:
+        print(f"Could not render the maps in parallel: {str(e)}. Rendering them one by one.")
+        return dict(zip(terms, render_map_chunk(region_interest, terms)))
+    return dict(zip(terms, figures))
+
+# Function to get the plotly template the maps are drawn with, as JSON
+def map_template_json():
+    import plotly.io as pio
+
+    return script_json(pio.templates[pio.templates.default].to_plotly_json())
+
+# Function to write plotly.js next to the report once, so the graph and every map share one copy
+def write_plotly_asset(output_dir):
+    import plotly
+    from plotly.offline import get_plotlyjs
+
+    name = f"plotly-{plotly.__version__}.min.js"
+    path = os.path.join(output_dir, name)
+    if not os.path.exists(path):
+        # Runs writing to the same directory at once each use their own temporary file
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            current_metrics().add("bytes_written", f.write(get_plotlyjs().encode("utf-8")))
+        os.replace(temp_path, path)
+    return name
+
+# Function to get a file name for a term's map that is safe on every file system
+def map_file_name(term):
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", term).strip("_")[:40]
+    return f"{slug}_{hashlib.sha1(term.encode('utf-8')).hexdigest()[:8]}.js"
+
+# Function to write every term's map as a small script that registers its figure with the report;
+# returns the script path of each term, relative to the report
+def write_map_assets(region_interest, search_terms, output_dir, maps_dir):
+    os.makedirs(os.path.join(output_dir, maps_dir), exist_ok=True)
+    map_files = {}
+    for term, figure_json in render_map_figures(region_interest, search_terms).items():
+        if not figure_json:
+            continue
+        path = f"{maps_dir}/{map_file_name(term)}"
+        with open(os.path.join(output_dir, path), "wb") as f:
+            script = f"registerMap({script_json(term)}, {figure_json});\n"
+            current_metrics().add("bytes_written", f.write(script.encode("utf-8")))
+        map_files[term] = path
+    return map_files
+
+# Function to get comparison data for the top region of every term at once. The data by region covers the
+# whole timeframe in one figure per region, so there are no month or week averages to give
+def get_top_region_comparison_data(region_interest):
+    columns = ["top_region", "top_region_year_avg"]
+    df = region_interest
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    top = pd.DataFrame({
+        "top_region": df.fillna(-1).idxmax(axis=0),
+        "top_region_year_avg": df.mean(axis=0),
+    })
+    top.loc[df.isnull().all(axis=0), "top_region"] = "N/A"
+    return top
+
+# Function to read search terms separated by commas or new lines from a file
+def read_terms_file(file_path, column=None):
+    return list(TermStream(file_path, column))
+
+# Function to clean terms as they come in: extra whitespace is removed, blanks are dropped and repeats are
+# skipped ignoring case, keeping the first spelling. Typed terms and terms files go through the same rules;
+# the skipped repeats are counted in duplicates, a Counter of the kept spellings, when given
+def clean_terms(terms, duplicates=None):
+    seen = {}  # Casefolded term to the spelling that was kept
+    for term in terms:
+        term = " ".join(term.split())
+        if not term:
+            continue
+        key = term.casefold()
+        if key in seen:
+            if duplicates is not None:
+                duplicates[seen[key]] += 1
+            continue
+        seen[key] = term
+        yield term
+
+# Terms read from a file one at a time, so fetching can start while a long keyword export is still being read.
+# Text files have a term per line or comma separated terms; in a CSV file every cell is a term, or only the
+# cells of one column, picked by its header or by number (1 is the first column, and then there is no header).
+# Terms are cleaned of extra whitespace and duplicates are skipped ignoring case; .terms has the terms read so far
+class TermStream:
+    def __init__(self, path, column=None, extra_terms=()):
+        self.path = path
+        self.column = column
+        self.extra_terms = list(extra_terms)  # Terms added after the file's, e.g. typed in the GUI
+        self.terms = []
+        self.duplicates = 0
+
+    def _raw_terms(self):
+        with open(self.path, "r", encoding="utf-8-sig", newline="") as file:
+            if self.column is None and not self.path.lower().endswith(".csv"):
+                for line in file:
+                    yield from line.split(",")
+                return
+
+            rows = csv.reader(file)
+            if self.column is None:
+                for row in rows:
+                    yield from row
+                return
+
+            column = str(self.column)
+            if column.isdigit():
+                index = int(column) - 1
+            else:
+                header = next(rows, [])
+                if column not in header:
+                    raise ValueError(f"Column '{column}' not found in {os.path.basename(self.path)}.")
+                index = header.index(column)
+            for row in rows:
+                if index < len(row):
+                    yield row[index]
+
+    def __iter__(self):
+        self.terms = []
+        duplicates = Counter()
+        for term in clean_terms(itertools.chain(self._raw_terms(), self.extra_terms), duplicates):
+            self.terms.append(term)
+            yield term
+        self.duplicates = sum(duplicates.values())
+        if self.duplicates:
+            print(f"Skipped {self.duplicates} duplicate terms in {os.path.basename(self.path)}.")
+
+# Function to pick a terms file in the GUI; the file is read while the run fetches, not loaded into the entry box
+def load_terms_from_file(file_var):
+    from tkinter import filedialog
 
-def compare_values(value, avg):
-    if value > avg:
-        return "green", "&#x25B2;"  # Upwards arrow
-    elif value < avg:
-        return "red", "&#x25BC;"  # Downwards arrow
-    else:
-        return "black", ""  # No change
-
-# Function to load search terms from a file
-def load_terms_from_file():
     file_path = filedialog.askopenfilename(filetypes=[("Text Files", "*.txt"), ("CSV Files", "*.csv")])
     if file_path:
-        with open(file_path, "r", encoding="utf-8") as file:
-            content = file.read()
-            terms = content.split(",")
-            terms = [term.strip() for term in terms if term.strip()]
-            entry.delete(0, tk.END)  # Clear current entry
-            entry.insert(0, ",".join(terms))  # Insert terms into the entry box
+        file_var.set(file_path)
 
-# Function to merge multiple HTML files
+# Function to turn one part of a report payload back into a frame
+def payload_frame(part, dates=True):
+    if dates:
+        index = pd.DatetimeIndex(pd.to_datetime(part["index"]), name="date")
+    else:
+        index = pd.Index(part["index"], name="geoName")
+    return pd.DataFrame({term: np.array(values, dtype=float) for term, values in part["columns"].items()},
+                        index=index)
+
+# Function to read the data payload of a saved report; only the file up to the end of the payload
+# is read and none of the HTML is parsed
+def read_report_payload(path, block_size=1 << 20):
+    marker = f'<script type="application/json" id="{report_payload_id}">'
+    buffer = ""
+    found = False
+    with open(path, "r", encoding="utf-8") as f:
+        for block in iter(lambda: f.read(block_size), ""):
+            buffer += block
+            if not found:
+                start = buffer.find(marker)
+                if start == -1:
+                    buffer = buffer[-len(marker):]
+                    continue
+                buffer = buffer[start + len(marker):]
+                found = True
+            # The payload escapes "</", so the first closing tag ends it
+            end = buffer.find("</script>")
+            if end != -1:
+                return json.loads(buffer[:end])
+    raise ValueError(f"{os.path.basename(path)} has no report data to merge; only reports written by this "
+                     f"version can be merged.")
+
+# Function to combine frames from several reports; the first report that has a term wins
+def union_frames(frames):
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    data = pd.concat(frames, axis=1).sort_index()
+    return data.loc[:, ~data.columns.duplicated()]
+
+# Function to merge saved reports by their data: the series of all reports are combined into one frame
+# per region and the stats are computed once for all terms
+def merge_reports(paths):
+    payloads = [read_report_payload(path) for path in paths]
+
+    all_data = union_frames(payload_frame(payload["global"]) for payload in payloads)
+    regions = list(dict.fromkeys(region for payload in payloads for region in payload["regions"]))
+    region_data = {region: union_frames(payload_frame(payload["regions"][region]) for payload in payloads
+                                        if region in payload["regions"])
+                   for region in regions}
+    region_interest = union_frames(payload_frame(payload["region_interest"], dates=False) for payload in payloads)
+
+    merged_stats = build_stats(list(all_data.columns), all_data, regions, region_data)
+    return all_data, merged_stats, regions, region_data, region_interest
 
 # Function to merge multiple HTML files
 def merge_html_files():
+    from tkinter import filedialog, messagebox
+
     files = filedialog.askopenfilenames(filetypes=[("HTML Files", "*.html")])
     if not files:
         return
 
-    merged_html = ""
-
-    for i, file in enumerate(files):
-        with open(file, "r", encoding="utf-8") as f:
-            soup = BeautifulSoup(f, 'html.parser')
-
-            # Extract the body content
-            body_content = soup.find('body')
-            if body_content:
-                merged_html += str(body_content)
-    
-    # Combine everything into a single HTML structure
-    final_html = f"""
-    <html>
-    <head>
-        <title>Google Trends Merged Comparison</title>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                margin: 20px;
-            }}
-            h2 {{
-                text-align: center;
-                margin-top: 40px;
-            }}
-            .container {{
-                max-width: 1000px;
-                margin: auto;
-            }}
-            .graph-container {{
-                margin-bottom: 40px;
-            }}
-            table {{
-                width: 100%;
-                border-collapse: collapse;
-            }}
-            th, td {{
-                padding: 10px;
-                border: 1px solid #ddd;
-            }}
-        </style>
-    </head>
-    <body>
-        {merged_html}
-    </body>
-    </html>
-    """
+    try:
+        merged = merge_reports(files)
+    except ValueError as e:
+        messagebox.showerror("Error", str(e))
+        return
 
     # Save the combined HTML file
     save_path = filedialog.asksaveasfilename(
@@ -593,264 +2626,269 @@ def merge_html_files():
         filetypes=[("HTML Files", "*.html")]
     )
     if save_path:
-        with open(save_path, "w", encoding="utf-8") as f:
-            f.write(final_html)
+        generate_combined_html(*merged, save_path)
         messagebox.showinfo("Success", f"Files merged and saved successfully as {os.path.basename(save_path)}!")
 
+# Function to write the merged report; it has the same layout and payload as a normal report,
+# so it can be merged again
+def generate_combined_html(data, stats, regions, region_data, region_interest, save_path, assets=report_assets):
+    import plotly.io as pio
 
-    # Remove duplicates in stats and sort combined stats
-    combined_stats = pd.DataFrame(combined_stats)
-    combined_stats = combined_stats.drop_duplicates().sort_values(by=1, ascending=False)
-
-    # Generate the combined graph and table
-    generate_combined_html(all_data, combined_stats)
+    output_dir = os.path.dirname(save_path) or "."
+    os.makedirs(output_dir, exist_ok=True)
 
-def generate_combined_html(data, stats):
     # Create the combined graph
-    fig = go.Figure()
-
-    for column in data.columns:
-        fig.add_trace(go.Scatter(x=data.index, y=data[column], mode='lines+markers', name=column,
-                                 hoverinfo='name+y', marker=dict(size=8), line=dict(width=2)))
-
-    fig.update_layout(
-        title='Google Trends Combined Comparison',
-        xaxis_title='Date',
-        yaxis_title='Search Interest',
-        hovermode='x unified',
-        margin=dict(l=40, r=40, t=40, b=40),
-        autosize=True,
-        showlegend=True,
-        hoverlabel=dict(bgcolor='white', bordercolor='black', font_size=12, namelength=0),
-        dragmode=False,
-    )
-
-    graph_html = pio.to_html(fig, full_html=False)
-
-    # Create the combined stats table
-    stats_html = "<table id='statsTable' style='width: 100%; border-collapse: collapse;'>"
-    stats_html += "<thead><tr><th>Term</th><th>Latest Value</th><th>Year Avg</th><th>Month Avg</th><th>Week Avg</th></tr></thead><tbody>"
-    
-    for index, row in stats.iterrows():
-        stats_html += f"<tr><td>{row[0]}</td><td>{row[1]}</td><td>{row[2]}</td><td>{row[3]}</td><td>{row[4]}</td></tr>"
-    
-    stats_html += "</tbody></table>"
-
-    # Combine the graph and stats into a single HTML
-    full_html = f"""
-    <html>
-    <head>
-    <title>Google Trends Combined Comparison</title>
-    <style>
-        body {{
-            font-family: Arial, sans-serif;
-            margin: 20px;
-        }}
-        h2 {{
-            text-align: center;
-            margin-top: 40px;
-        }}
-        .container {{
-            max-width: 1000px;
-            margin: auto;
-        }}
-        .graph-container {{
-            margin-bottom: 40px;
-        }}
-        table {{
-            width: 100%;
-            border-collapse: collapse;
-        }}
-        th, td {{
-            padding: 10px;
-            border: 1px solid #ddd;
-        }}
-    </style>
-    </head>
-    <body>
-    <div class="container">
-        <div class="graph-container">
-            <div class="graph">
-                {graph_html}
-            </div>
-        </div>
-        <h2>Combined Stats</h2>
-        <div>
-            {stats_html}
-        </div>
-    </div>
-    </body>
-    </html>
-    """
-
-    # Save the combined HTML file
-    save_path = filedialog.asksaveasfilename(
-        defaultextension=".html",
-        initialfile="google_comparisons_merged",
-        filetypes=[("HTML Files", "*.html")]
-    )
-    if save_path:
-        with open(save_path, "w", encoding="utf-8") as f:
-            f.write(full_html)
-        messagebox.showinfo("Success", f"Files merged and saved successfully as {os.path.basename(save_path)}!")
-
-
-    # Remove duplicates and sort combined stats
-    combined_stats = pd.DataFrame(combined_stats)
-    combined_stats = combined_stats.drop_duplicates().sort_values(by=1, ascending=False)
-
-    # Generate the combined graph and table
-    generate_combined_html(all_data, combined_stats)
-
-def generate_combined_html(data, stats):
-    # Create the combined graph
-    fig = go.Figure()
-
-    for column in data.columns:
-        fig.add_trace(go.Scatter(x=data.index, y=data[column], mode='lines+markers', name=column,
-                                 hoverinfo='name+y', marker=dict(size=8), line=dict(width=2)))
-
-    fig.update_layout(
-        title='Google Trends Combined Comparison',
-        xaxis_title='Date',
-        yaxis_title='Search Interest',
-        hovermode='x unified',
-        margin=dict(l=40, r=40, t=40, b=40),
-        autosize=True,
-        showlegend=True,
-        hoverlabel=dict(bgcolor='white', bordercolor='black', font_size=12, namelength=0),
-        dragmode=False,
-    )
-
-    graph_html = pio.to_html(fig, full_html=False)
-
-    # Create the combined stats table
-    stats_html = "<table id='statsTable' style='width: 100%; border-collapse: collapse;'>"
-    stats_html += "<thead><tr><th>Term</th><th>Latest Value</th><th>Year Avg</th><th>Month Avg</th><th>Week Avg</th></tr></thead><tbody>"
-    
-    for index, row in stats.iterrows():
-        stats_html += f"<tr><td>{row[0]}</td><td>{row[1]}</td><td>{row[2]}</td><td>{row[3]}</td><td>{row[4]}</td></tr>"
-    
-    stats_html += "</tbody></table>"
-
-    # Combine the graph and stats into a single HTML
-    full_html = f"""
-    <html>
-    <head>
-    <title>Google Trends Combined Comparison</title>
-    <style>
-        body {{
-            font-family: Arial, sans-serif;
-            margin: 20px;
-        }}
-        h2 {{
-            text-align: center;
-            margin-top: 40px;
-        }}
-        .container {{
-            max-width: 1000px;
-            margin: auto;
-        }}
-        .graph-container {{
-            margin-bottom: 40px;
-        }}
-        table {{
-            width: 100%;
-            border-collapse: collapse;
-        }}
-        th, td {{
-            padding: 10px;
-            border: 1px solid #ddd;
-        }}
-    </style>
-    </head>
-    <body>
-    <div class="container">
-        <div class="graph-container">
-            <div class="graph">
-                {graph_html}
-            </div>
-        </div>
-        <h2>Combined Stats</h2>
-        <div>
-            {stats_html}
-        </div>
-    </div>
-    </body>
-    </html>
-    """
-
-    # Save the combined HTML file
-    save_path = filedialog.asksaveasfilename(
-        defaultextension=".html",
-        initialfile="google_comparisons_merged",
-        filetypes=[("HTML Files", "*.html")]
-    )
-    if save_path:
-        with open(save_path, "w", encoding="utf-8") as f:
-            f.write(full_html)
-        messagebox.showinfo("Success", f"Files merged and saved successfully as {os.path.basename(save_path)}!")
-
-# Set up the GUI with ttk widgets and custom styles
-root = tk.Tk()
-root.title("Google Trends Comparison")
-root.geometry("600x500")
-root.configure(bg="#f0f0f0")
-
-# Define style for buttons and entries
-style = ttk.Style()
-style.configure("TButton", font=("Arial", 12), padding=10)
-style.configure("TEntry", font=("Arial", 12), padding=5)
-
-# Frame to hold entry and load button
-entry_frame = ttk.Frame(root)
-entry_frame.pack(pady=10)
-
-# Entry widget to input search terms
-entry = ttk.Entry(entry_frame, width=50)
-entry.grid(row=0, column=0, padx=(0, 10))
-
-# Button to load terms from file, integrated with the entry box
-file_button = ttk.Button(entry_frame, text="Load from file (.csv .txt)", command=load_terms_from_file)
-file_button.grid(row=0, column=1)
-
-# Dropdown menus for selecting regions
-regions = ["", "US", "CA", "GB", "AU", "DE", "FR", "IN", "JP", "CN", "BR", "ZA"]  # Add more regions as needed
-
-region1_label = tk.Label(root, text="Select Region 1 (optional):", bg="#f0f0f0")
-region1_label.pack(pady=5)
-region1_dropdown = ttk.Combobox(root, values=regions, state="readonly")
-region1_dropdown.pack(pady=5)
-
-region2_label = tk.Label(root, text="Select Region 2 (optional):", bg="#f0f0f0")
-region2_label.pack(pady=5)
-region2_dropdown = ttk.Combobox(root, values=regions, state="readonly")
-region2_dropdown.pack(pady=5)
-
-# Option to generate the map
-map_var = tk.BooleanVar(value=False)
-map_checkbox = ttk.Checkbutton(root, text="Generate World Map", variable=map_var)
-map_checkbox.pack(pady=5)
-
-# Button to trigger the plotting
-plot_button = ttk.Button(root, text="Plot Trends", command=lambda: plot_trends(entry.get().split(','), region1_dropdown.get(), region2_dropdown.get(), map_var.get()))
-plot_button.pack(pady=10)
-
-# Entry widget to input filename
-filename_label = tk.Label(root, text="Enter filename (optional):", bg="#f0f0f0")
-filename_label.pack(pady=10)
-
-filename_entry = ttk.Entry(root, width=50)
-filename_entry.pack(pady=10)
-
-# Frame to hold the merge button
-button_frame = ttk.Frame(root)
-button_frame.pack(pady=20)  # Increase the padding around the frame
-
-# Button to merge datasets with increased padding and width
-merge_button = ttk.Button(button_frame, text="Merge Datasets", command=merge_html_files, width=20)
-merge_button.pack(pady=10, padx=10)  # Increase both vertical and horizontal padding
-
-# Run the GUI main loop
-root.mainloop()
+    fig = build_trend_figure(data, data.columns, 'Google Trends Combined Comparison', list(stats["term"]))
+    plotlyjs = write_plotly_asset(output_dir) if assets == "shared" else True
+    graph_html = pio.to_html(fig, full_html=False, include_plotlyjs=plotlyjs)
+
+    write_report(save_path, html_report_chunks(graph_html, stats, list(data.columns), [], regions, region_interest,
+                                               False, payload=report_payload_chunks(data, region_data, region_interest),
+                                               title="Google Trends Combined Comparison",
+                                               cluster_html=cluster_section_html(data, stats)))
+    return save_path
+
+# Function to set up the GUI with ttk widgets and custom styles
+def build_gui():
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+
+    # The comparison runs on this worker so the window stays responsive; events come back through the queue
+    executor = ThreadPoolExecutor(max_workers=1)
+    events = queue.Queue()
+    run_state = {"cancel_event": None}
+
+    root = tk.Tk()
+    root.title("Google Trends Comparison")
+    root.geometry("600x700")
+    root.configure(bg="#f0f0f0")
+
+    # Define style for buttons and entries
+    style = ttk.Style()
+    style.configure("TButton", font=("Arial", 12), padding=10)
+    style.configure("TEntry", font=("Arial", 12), padding=5)
+
+    # Frame to hold entry and load button
+    entry_frame = ttk.Frame(root)
+    entry_frame.pack(pady=10)
+
+    # Entry widget to input search terms
+    entry = ttk.Entry(entry_frame, width=50)
+    entry.grid(row=0, column=0, padx=(0, 10))
+
+    # Button to pick a terms file; its terms are compared together with any typed in the entry box
+    file_var = tk.StringVar(value="")
+    file_button = ttk.Button(entry_frame, text="Load from file (.csv .txt)", command=lambda: load_terms_from_file(file_var))
+    file_button.grid(row=0, column=1)
+    file_label = tk.Label(entry_frame, textvariable=file_var, bg="#f0f0f0")
+    file_label.grid(row=1, column=0, sticky="w")
+    clear_file_button = ttk.Button(entry_frame, text="Clear file", command=lambda: file_var.set(""))
+    clear_file_button.grid(row=1, column=1)
+
+    # List for selecting any number of regions
+    region_choices = ["US", "CA", "GB", "AU", "DE", "FR", "IN", "JP", "CN", "BR", "ZA"]  # Add more regions as needed
+
+    regions_label = tk.Label(root, text="Select Regions (optional, multiple allowed):", bg="#f0f0f0")
+    regions_label.pack(pady=5)
+    regions_listbox = tk.Listbox(root, selectmode=tk.MULTIPLE, height=6, exportselection=False)
+    for region in region_choices:
+        regions_listbox.insert(tk.END, region)
+    regions_listbox.pack(pady=5)
+
+    # Option to generate the map
+    map_var = tk.BooleanVar(value=False)
+    map_checkbox = ttk.Checkbutton(root, text="Generate World Map", variable=map_var)
+    map_checkbox.pack(pady=5)
+
+    # Timeframe, with the option to stitch daily points over spans longer than Google returns them for
+    timeframe_frame = ttk.Frame(root)
+    timeframe_frame.pack(pady=5)
+    timeframe_label = tk.Label(timeframe_frame, text="Timeframe:", bg="#f0f0f0")
+    timeframe_label.grid(row=0, column=0, padx=5)
+    timeframe_var = tk.StringVar(value="today 12-m")
+    timeframe_box = ttk.Combobox(timeframe_frame, textvariable=timeframe_var, values=timeframe_choices, width=15)
+    timeframe_box.grid(row=0, column=1, padx=5)
+    daily_var = tk.BooleanVar(value=False)
+    daily_checkbox = ttk.Checkbutton(timeframe_frame, text="Daily points", variable=daily_var)
+    daily_checkbox.grid(row=0, column=2, padx=5)
+
+    # Option to pick up an interrupted run with the same terms and filename where it stopped
+    resume_var = tk.BooleanVar(value=False)
+    resume_checkbox = ttk.Checkbutton(root, text="Resume interrupted run", variable=resume_var)
+    resume_checkbox.pack(pady=5)
+
+    # Function to start a run in the background
+    def start_run():
+        if run_state["cancel_event"] is not None:
+            return
+        run_state["cancel_event"] = threading.Event()
+        plot_button.config(state="disabled")
+        cancel_button.config(state="normal")
+        progress_bar.config(value=0)
+        status_var.set("Starting...")
+        search_terms = entry.get().split(',')
+        if file_var.get():
+            search_terms = TermStream(file_var.get(), extra_terms=search_terms)
+        executor.submit(plot_trends, search_terms, [regions_listbox.get(i) for i in regions_listbox.curselection()],
+                        map_var.get(), filename=filename_entry.get(), events=events,
+                        cancel_event=run_state["cancel_event"], timeframe=timeframe_var.get().strip(),
+                        daily=daily_var.get(), resume=resume_var.get())
+        root.after(200, poll_events)
+
+    # Function to ask the running fetch to stop; the report is built from the data fetched so far
+    def cancel_run():
+        if run_state["cancel_event"] is not None:
+            run_state["cancel_event"].set()
+            cancel_button.config(state="disabled")
+            status_var.set("Cancelling, keeping the results fetched so far...")
+
+    def finish_run():
+        run_state["cancel_event"] = None
+        plot_button.config(state="normal")
+        cancel_button.config(state="disabled")
+
+    # Function to apply the worker's progress events to the widgets, on the Tk thread
+    def poll_events():
+        while True:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event["stage"] == "fetch":
+                if event["total"]:
+                    progress_bar.config(maximum=event["total"], value=event["done"])
+                    status = f"Fetched {event['done']} of {event['total']} groups"
+                else:
+                    status = f"Fetched {event['done']} groups, still reading the terms file"
+                if event["backoff"] > 0:
+                    status += f", rate limited: waiting {event['backoff']:.0f} s"
+                if event["eta"] is not None:
+                    status += f", about {event['eta']:.0f} s left"
+                status_var.set(status)
+            elif event["stage"] == "report":
+                status_var.set("Writing the report...")
+            elif event["stage"] == "done":
+                status_var.set("Cancelled, partial report written" if event["cancelled"] else "Done")
+                finish_run()
+                webbrowser.open(f"file://{os.path.abspath(event['report'])}")
+                return
+            elif event["stage"] == "error":
+                status_var.set("Failed")
+                finish_run()
+                messagebox.showerror("Error", event["message"])
+                return
+        root.after(200, poll_events)
+
+    # Buttons to trigger and cancel the plotting
+    plot_frame = ttk.Frame(root)
+    plot_frame.pack(pady=10)
+    plot_button = ttk.Button(plot_frame, text="Plot Trends", command=start_run)
+    plot_button.grid(row=0, column=0, padx=5)
+    cancel_button = ttk.Button(plot_frame, text="Cancel", command=cancel_run, state="disabled")
+    cancel_button.grid(row=0, column=1, padx=5)
+
+    # Progress of the running fetch
+    progress_bar = ttk.Progressbar(root, length=400, mode="determinate")
+    progress_bar.pack(pady=5)
+    status_var = tk.StringVar(value="")
+    status_label = tk.Label(root, textvariable=status_var, bg="#f0f0f0")
+    status_label.pack(pady=5)
+
+    # Entry widget to input filename
+    filename_label = tk.Label(root, text="Enter filename (optional):", bg="#f0f0f0")
+    filename_label.pack(pady=10)
+
+    filename_entry = ttk.Entry(root, width=50)
+    filename_entry.pack(pady=10)
+
+    # Frame to hold the merge button
+    button_frame = ttk.Frame(root)
+    button_frame.pack(pady=20)  # Increase the padding around the frame
+
+    # Button to merge datasets with increased padding and width
+    merge_button = ttk.Button(button_frame, text="Merge Datasets", command=merge_html_files, width=20)
+    merge_button.pack(pady=10, padx=10)  # Increase both vertical and horizontal padding
+
+    # Function to close the window; a running fetch is cancelled so its worker stops waiting on
+    # the rate limit and the process can exit instead of running on without a window
+    def close_window():
+        if run_state["cancel_event"] is not None:
+            run_state["cancel_event"].set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", close_window)
+
+    return root
+
+# Function to run the comparison from the command line without the GUI
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare Google Trends search interest for a list of terms.")
+    parser.add_argument("terms_file", nargs="?", help="Text or CSV file with terms separated by commas or new lines")
+    parser.add_argument("--column", help="Only read this CSV column, by header name or number (1 is the first)")
+    parser.add_argument("--terms", default="", help="Comma separated terms, used in addition to the file")
+    parser.add_argument("--regions", nargs="*", default=[], help="Region codes to compare, e.g. US GB DE")
+    parser.add_argument("--timeframe", default="today 12-m", help="Google Trends timeframe, e.g. 'today 5-y'")
+    parser.add_argument("--daily", action="store_true",
+                        help="Daily points for timeframes longer than Google gives them for, stitched from windows")
+    parser.add_argument("--anchor", help="Term included in every group to put all groups on one scale")
+    parser.add_argument("--output-dir", default=".", help="Directory for the report and map files")
+    parser.add_argument("--output", default="google_trends_comparison.html", help="Report filename")
+    parser.add_argument("--map", action="store_true", help="Also generate a world map per term")
+    parser.add_argument("--open", action="store_true", help="Open the report in the browser when done")
+    parser.add_argument("--rate", type=float, default=request_rate, help="Requests per second to allow")
+    parser.add_argument("--base-url", default=trends_base_url, help="Trends URL, e.g. a local stand-in server")
+    parser.add_argument("--assets", choices=["shared", "inline"], default=report_assets,
+                        help="Write plotly.js and the maps next to the report, or put everything in one page")
+    parser.add_argument("--from-store", action="store_true",
+                        help="Report on the newest stored data for the terms instead of fetching")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Only fetch terms that are new or whose stored data is older than --max-age")
+    parser.add_argument("--max-age", type=float, default=refresh_max_age / 3600,
+                        help="Hours before stored data is fetched again with --refresh")
+    parser.add_argument("--store-dir", default=store_dir, help="Directory of the snapshot store")
+    parser.add_argument("--merge", nargs="+", metavar="REPORT",
+                        help="Merge saved reports into one report instead of fetching")
+    parser.add_argument("--top", type=int, default=visible_series,
+                        help="Only show the top N terms in the chart at first, the rest from the legend")
+    parser.add_argument("--metrics", help="Write the run's timings as JSON, in the trace event format, to this file")
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume an interrupted run from its journal, only fetching what it had not fetched yet")
+    args = parser.parse_args(argv)
+
+    trends_client_pool.base_url = args.base_url
+    store = TrendsStore(args.store_dir) if trends_store is not None else None
+
+    if args.merge:
+        try:
+            merged = merge_reports(args.merge)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        report_path = generate_combined_html(*merged, os.path.join(args.output_dir, args.output), args.assets)
+        print(f"Merged {len(args.merge)} reports into {report_path}")
+        return 0
+
+    # A terms file is read while the first groups are fetched
+    if args.terms_file:
+        search_terms = TermStream(args.terms_file, args.column, args.terms.split(","))
+    else:
+        search_terms = args.terms.split(",")
+    print(f"Startup took {time.perf_counter() - started_at:.2f} seconds")
 
+    try:
+        report_path = run_comparison(search_terms, args.regions, args.map, args.anchor, args.timeframe,
+                                     args.output_dir, args.output, args.open, args.rate,
+                                     assets=args.assets, visible=args.top, store=store,
+                                     from_store=args.from_store, refresh=args.refresh,
+                                     max_age=args.max_age * 3600, daily=args.daily, metrics_path=args.metrics,
+                                     resume=args.resume)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    print(f"Report written to {report_path}")
+    return 0
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(main())
+    build_gui().mainloop()
@@ -0,0 +1,367 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import Googletrendanalys as gta
+import fake_trends_server
+
+# Benchmarks for the report pipeline, run with synthetic data or against the local stand-in server,
+# so no requests are made to Google
+
+# Function to build synthetic weekly interest data and region interest for a number of terms
+def synthetic_data(term_count, periods=53, seed=0):
+    rng = np.random.default_rng(seed)
+    terms = [f"term {i}" for i in range(term_count)]
+    index = pd.date_range(end=pd.Timestamp.today().normalize(), periods=periods, freq="W-SUN")
+    data = pd.DataFrame(rng.integers(0, 101, (periods, term_count)).astype(float), index=index, columns=terms)
+    countries = ["United States", "United Kingdom", "Germany", "France", "Japan", "Brazil"]
+    region_interest = pd.DataFrame(rng.integers(0, 101, (len(countries), term_count)).astype(float),
+                                   index=pd.Index(countries, name="geoName"), columns=terms)
+    return terms, data, region_interest
+
+# Function to build synthetic daily interest data with a yearly season, a trend and noise
+def synthetic_daily_data(term_count, years=5, seed=0):
+    rng = np.random.default_rng(seed)
+    periods = int(365.25 * years)
+    index = pd.date_range(end=pd.Timestamp.today().normalize(), periods=periods, freq="D")
+    days = np.arange(periods, dtype=np.float32)[:, np.newaxis]
+    phase = rng.random(term_count, dtype=np.float32) * 2 * np.pi
+    trend = rng.normal(0, 0.01, term_count).astype(np.float32)
+    values = 50 + 20 * np.sin(2 * np.pi * days / 365.25 + phase) + trend * days
+    values += rng.normal(0, 5, (periods, term_count)).astype(np.float32)
+    return pd.DataFrame(np.clip(values, 0, None), index=index, columns=[f"term {i}" for i in range(term_count)])
+
+# Function to time a call and record its peak traced memory
+def measure(function, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+# Function to get the peak resident memory of the process so far, in MB; tracing allocations would slow a
+# whole run down several times, so the end to end runs use this instead
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+# Function to write the stats table report the old way: the whole document joined into one string first
+def write_concatenated(path, chunks):
+    document = ""
+    for chunk in chunks:
+        document += chunk
+    with open(path, "wb") as f:
+        return f.write(document.encode("utf-8"))
+
+# Function to benchmark writing the report for each term count, streaming and concatenated
+def benchmark_report_writer(term_counts, regions=("US", "GB")):
+    results = []
+    graph_html = "<div>graph</div>"
+    with tempfile.TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, "report.html")
+        for term_count in term_counts:
+            terms, data, region_interest = synthetic_data(term_count)
+            region_data = {region: data for region in regions}
+            stats = gta.build_stats(terms, data, list(regions), region_data)
+
+            for mode, writer in (("streaming", gta.write_report), ("concatenated", write_concatenated)):
+                chunks = gta.html_report_chunks(graph_html, stats, terms, [], list(regions), region_interest, True, {})
+                size, elapsed, peak = measure(writer, path, chunks)
+                results.append({
+                    "benchmark": "report_writer",
+                    "mode": mode,
+                    "terms": term_count,
+                    "seconds": round(elapsed, 4),
+                    "peak_memory_mb": round(peak / 1024 / 1024, 2),
+                    "report_mb": round(os.path.getsize(path) / 1024 / 1024, 2),
+                })
+    return results
+
+# Function to benchmark the stats, with the trend analytics and the term similarity, on daily data for each term count
+def benchmark_analytics(term_counts, years=5):
+    results = []
+    for term_count in term_counts:
+        data = synthetic_daily_data(term_count, years)
+        for name, function in (("period_stats", gta.compute_period_stats),
+                               ("trend_analytics", gta.compute_trend_analytics),
+                               ("term_similarity", gta.compute_term_similarity)):
+            started = time.perf_counter()
+            function(data)
+            results.append({
+                "benchmark": name,
+                "terms": term_count,
+                "days": len(data),
+                "seconds": round(time.perf_counter() - started, 4),
+            })
+    return results
+
+# Function to write the report and maps the old way: plotly.js inlined in the report and in a page per term
+def write_legacy_maps(output_dir, data, terms, region_interest):
+    import plotly.express as px
+    import plotly.io as pio
+
+    gta.generate_html_output(data, terms, [], [], {}, region_interest, False, output_dir, "report.html", "inline")
+    map_files = {}
+    for term in terms:
+        fig = px.choropleth(region_interest[[term]].reset_index(), locations='geoName', locationmode='country names',
+                            color=term, title=f'Worldwide Search Interest for {term}',
+                            color_continuous_scale='Viridis')
+        fig.update_layout(geo=dict(showcoastlines=True, coastlinecolor="Black"))
+        map_files[term] = f"{term}_map.html"
+        with open(os.path.join(output_dir, map_files[term]), "w", encoding="utf-8") as f:
+            f.write(pio.to_html(fig, full_html=False))
+    return map_files
+
+# Function to add up the size of every file under a directory
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+# Function to benchmark the map output for each term count: disk size, the bytes a browser loads to open the
+# report with its first map, the bytes loaded for every further map, and the time to write it all
+def benchmark_map_assets(term_counts):
+    results = []
+    for term_count in term_counts:
+        terms, data, region_interest = synthetic_data(term_count)
+        stats = gta.build_stats(terms, data, [], {})
+        for mode in ("legacy", "shared", "inline"):
+            with tempfile.TemporaryDirectory() as output_dir:
+                report_path = os.path.join(output_dir, "report.html")
+                started = time.perf_counter()
+                if mode == "legacy":
+                    # The report could not show a map, each one had to be opened as its own page
+                    map_files = write_legacy_maps(output_dir, data, terms, region_interest)
+                    opened = os.path.getsize(report_path)
+                else:
+                    gta.generate_html_output(data, terms, [], [], {}, region_interest, True, output_dir,
+                                             "report.html", mode, stats=stats)
+                    map_files = {}
+                    if mode == "shared":
+                        maps_dir = os.path.join(output_dir, "report_maps")
+                        map_files = {name: os.path.join("report_maps", name) for name in os.listdir(maps_dir)}
+                    opened = directory_size(output_dir) - sum(os.path.getsize(os.path.join(output_dir, path))
+                                                              for path in map_files.values())
+                elapsed = time.perf_counter() - started
+                per_map = [os.path.getsize(os.path.join(output_dir, path)) for path in map_files.values()]
+                if mode == "shared":
+                    opened += per_map[0]
+                results.append({
+                    "benchmark": "map_assets",
+                    "mode": mode,
+                    "terms": term_count,
+                    "seconds": round(elapsed, 4),
+                    "disk_mb": round(directory_size(output_dir) / 1024 / 1024, 2),
+                    "open_mb": round(opened / 1024 / 1024, 2),
+                    "per_map_kb": round(sum(per_map) / len(per_map) / 1024, 1) if per_map else 0,
+                })
+    return results
+
+# Function to benchmark rendering every term's map in this process and across the render pool; both must give
+# exactly the same figures
+def benchmark_map_render(term_counts, workers=0):
+    results = []
+    for term_count in term_counts:
+        terms, _, region_interest = synthetic_data(term_count)
+        rendered = {}
+        for mode, mode_workers in (("serial", 1), ("parallel", workers)):
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                rendered[mode] = gta.render_map_figures(region_interest, terms, mode_workers)
+            results.append({
+                "benchmark": "map_render",
+                "mode": mode,
+                "terms": term_count,
+                "workers": mode_workers or os.cpu_count(),
+                "seconds": round(time.perf_counter() - started, 4),
+                "identical": rendered[mode] == rendered["serial"],
+            })
+    return results
+
+# Function to merge reports the old way: every file parsed with BeautifulSoup and the bodies joined
+def merge_by_body(paths):
+    from bs4 import BeautifulSoup
+
+    merged_html = ""
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            body = BeautifulSoup(f, 'html.parser').find('body')
+            if body:
+                merged_html += str(body)
+    return merged_html
+
+# Function to benchmark merging saved reports, from their data payload and the old way
+def benchmark_merge(report_count, terms_per_report=20, regions=("US", "GB")):
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        paths = []
+        for i in range(report_count):
+            terms, data, region_interest = synthetic_data(terms_per_report, seed=i)
+            terms = [f"{term} of report {i}" for term in terms]
+            data.columns = region_interest.columns = terms
+            region_data = {region: data for region in regions}
+            stats = gta.build_stats(terms, data, list(regions), region_data)
+            paths.append(gta.generate_html_output(data, terms, [], list(regions), region_data, region_interest,
+                                                  False, output_dir, f"report_{i}.html", "inline", stats=stats))
+
+        for mode in ("payload", "legacy"):
+            started = time.perf_counter()
+            if mode == "payload":
+                merged_path = os.path.join(output_dir, "merged.html")
+                gta.generate_combined_html(*gta.merge_reports(paths), merged_path, "inline")
+                size = os.path.getsize(merged_path)
+            else:
+                size = len(merge_by_body(paths).encode("utf-8"))
+            results.append({
+                "benchmark": "merge",
+                "mode": mode,
+                "reports": report_count,
+                "seconds": round(time.perf_counter() - started, 4),
+                "merged_mb": round(size / 1024 / 1024, 2),
+            })
+    return results
+
+# Function to build a synthetic corpus of distinct search terms, like a product list loaded from a file
+def synthetic_corpus(term_count, seed=0):
+    rng = np.random.default_rng(seed)
+    brands = ["acme", "globex", "initech", "umbrella", "hooli", "stark", "wayne", "wonka", "tyrell", "soylent"]
+    products = ["phone", "laptop", "headphones", "blender", "sneakers", "jacket", "camera", "watch", "lamp", "desk"]
+    terms = [f"{rng.choice(brands)} {rng.choice(products)} {i}" for i in range(term_count)]
+    return terms
+
+# Function to swap in a rate limiter with a shorter 429 backoff, so injected rate limits cost the benchmark
+# seconds instead of minutes; the limiter behaves the same otherwise
+@contextlib.contextmanager
+def short_backoff(seconds):
+    limiter_class = gta.AdaptiveRateLimiter
+
+    class BenchmarkRateLimiter(limiter_class):
+        def __init__(self, *args, **kwargs):
+            kwargs.setdefault("backoff", seconds)
+            super().__init__(*args, **kwargs)
+
+    gta.AdaptiveRateLimiter = BenchmarkRateLimiter
+    try:
+        yield
+    finally:
+        gta.AdaptiveRateLimiter = limiter_class
+
+# Function to benchmark whole runs, from the terms file to the written report, against the local stand-in
+# server for each corpus size: wall time, requests issued, 429s, time spent sleeping, the stats and report
+# time and the peak memory of the process. Every run starts with an empty cache
+def benchmark_end_to_end(term_counts, latency=0.0, rate_limit=0.0, padding=0, rate=100.0, backoff=1.0,
+                         regions=("US",)):
+    results = []
+    server, base_url = fake_trends_server.start_server(latency=latency, rate_limit_probability=rate_limit,
+                                                       payload_padding=padding)
+    gta.trends_client_pool.close()
+    gta.trends_client_pool.base_url = base_url
+    cache_directory = gta.trends_cache.directory
+    try:
+        for term_count in term_counts:
+            with tempfile.TemporaryDirectory() as output_dir, short_backoff(backoff):
+                terms_path = os.path.join(output_dir, "terms.txt")
+                with open(terms_path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(synthetic_corpus(term_count)))
+                gta.trends_cache.directory = os.path.join(output_dir, "cache")
+                before = server.state.snapshot()
+
+                # The run prints its progress and summary; only the numbers are kept
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run = gta.ComparisonRun(gta.TermStream(terms_path), list(regions), output_dir=output_dir,
+                                            rate=rate, store=None)
+                    report_path = run.execute()
+                elapsed = time.perf_counter() - started
+                after = server.state.snapshot()
+                summary = run.metrics.summary()
+                stages = summary["stages"]
+                results.append({
+                    "benchmark": "end_to_end",
+                    "terms": term_count,
+                    "latency": latency,
+                    "rate_limit": rate_limit,
+                    "padding": padding,
+                    "seconds": round(elapsed, 3),
+                    "requests": after["requests"] - before["requests"],
+                    "rate_limited": after["rate_limited"] - before["rate_limited"],
+                    "sleep_seconds": round(sum(value for name, value in summary["counters"].items()
+                                               if name.startswith("sleep_seconds.")), 3),
+                    "fetch_seconds": round(stages.get("fetch", {}).get("seconds", 0), 3),
+                    "stats_seconds": round(stages.get("stats", {}).get("seconds", 0), 3),
+                    "report_seconds": round(stages.get("report", {}).get("seconds", 0), 3),
+                    "peak_rss_mb": peak_rss_mb(),
+                    "report_mb": round(os.path.getsize(report_path) / 1024 / 1024, 2),
+                })
+    finally:
+        gta.trends_cache.directory = cache_directory
+        gta.trends_client_pool.close()
+        gta.trends_client_pool.base_url = gta.trends_base_url
+        server.shutdown()
+    return results
+
+# Function to print benchmark results as an aligned table
+def print_results(results):
+    columns = list(results[0].keys())
+    widths = {column: max(len(column), *(len(str(row[column])) for row in results)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in results:
+        print("  ".join(str(row[column]).ljust(widths[column]) for column in columns))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Google Trends report pipeline")
+    parser.add_argument("--terms", type=int, nargs="*", default=[100, 1000, 10000], help="Term counts to run")
+    parser.add_argument("--map-terms", type=int, nargs="*", default=[10, 50], help="Term counts for the map output")
+    parser.add_argument("--merge-reports", type=int, default=50, help="Number of reports to merge")
+    parser.add_argument("--render-terms", type=int, nargs="*", default=[100, 500], help="Term counts to render maps for")
+    parser.add_argument("--render-workers", type=int, default=gta.render_workers,
+                        help="Processes to render the maps on; 0 uses every core")
+    parser.add_argument("--e2e-terms", type=int, nargs="*", default=[10, 100, 1000, 10000],
+                        help="Corpus sizes for the end to end runs against the stand-in server")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the stand-in server adds to every response")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="Probability of the stand-in server answering with a 429")
+    parser.add_argument("--padding", type=int, default=0, help="Extra bytes added to every stand-in server response")
+    parser.add_argument("--rate", type=float, default=100.0, help="Requests per second allowed in the end to end runs")
+    parser.add_argument("--only", nargs="*", choices=["report", "maps", "render", "analytics", "merge", "end_to_end"],
+                        help="Only run these benchmarks")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    benchmarks = {
+        "report": lambda: benchmark_report_writer(args.terms),
+        "maps": lambda: benchmark_map_assets(args.map_terms),
+        "render": lambda: benchmark_map_render(args.render_terms, args.render_workers),
+        "analytics": lambda: benchmark_analytics(args.terms),
+        "merge": lambda: benchmark_merge(args.merge_reports),
+        "end_to_end": lambda: benchmark_end_to_end(args.e2e_terms, args.latency, args.rate_limit, args.padding,
+                                                   args.rate),
+    }
+    results = []
+    for name, benchmark in benchmarks.items():
+        if args.only and name not in args.only:
+            continue
+        benchmark_results = benchmark()
+        if results:
+            print()
+        print_results(benchmark_results)
+        results += benchmark_results
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
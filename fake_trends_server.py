@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for the Google Trends endpoints used by pytrends, for testing without hitting Google.
+# Point Googletrendanalys.trends_base_url (or a TrendsClientPool base_url) at http://127.0.0.1:<port>/trends
+
+countries = [
+    ("United States", "US"), ("United Kingdom", "GB"), ("Canada", "CA"), ("Australia", "AU"),
+    ("Germany", "DE"), ("France", "FR"), ("India", "IN"), ("Japan", "JP"), ("China", "CN"),
+    ("Brazil", "BR"), ("South Africa", "ZA"), ("Spain", "ES"), ("Italy", "IT"), ("Mexico", "MX"),
+]
+
+# Function to get a stable pseudo random number for a set of values
+def seeded(*values):
+    digest = hashlib.sha256(json.dumps(values).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) / 0xFFFFFFFF
+
+# Function to turn a Trends timeframe into a list of timestamps at Google's resolution
+def timeline(timeframe, today=None):
+    today = today or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    if timeframe.startswith("today "):
+        amount, unit = timeframe.split(" ")[1].split("-")
+        days = {"d": 1, "m": 30, "y": 365}[unit] * int(amount)
+        start, end = today - timedelta(days=days), today
+    elif timeframe == "all":
+        start, end = datetime(2004, 1, 1), today
+    else:
+        start, end = [datetime.strptime(part, "%Y-%m-%d") for part in timeframe.split(" ")]
+
+    span = (end - start).days
+    if span <= 270:
+        step = timedelta(days=1)
+    elif span <= 5 * 365:
+        step = timedelta(days=7)
+        start += timedelta(days=(6 - start.weekday()) % 7)  # Weeks start on Sunday
+    else:
+        step = timedelta(days=30)
+
+    points = []
+    current = start
+    while current <= end:
+        points.append(current)
+        current += step
+    return points
+
+# Function to build the interest values for a set of keywords, scaled so the largest is 100
+def keyword_series(keywords, geo, points):
+    raw = []
+    for keyword in keywords:
+        base = 5 + 95 * seeded(keyword, geo)
+        phase = 2 * math.pi * seeded(keyword, "phase")
+        trend = seeded(keyword, "trend") - 0.5
+        series = []
+        for point in points:
+            day = point.toordinal()
+            season = 1 + 0.3 * math.sin(2 * math.pi * day / 365.25 + phase)
+            drift = 1 + trend * (day - 738000) / 3650
+            series.append(max(base * season * drift, 0))
+        raw.append(series)
+
+    peak = max((max(series) for series in raw if series), default=0) or 1
+    return [[int(round(value * 100 / peak)) for value in series] for series in raw]
+
+class FakeTrendsState:
+    def __init__(self, latency=0.0, rate_limit_probability=0.0, payload_padding=0):
+        self.latency = latency
+        self.rate_limit_probability = rate_limit_probability
+        self.payload_padding = payload_padding  # Extra bytes added to each data response
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.bootstraps = 0  # Cookie requests to /trends/explore
+        self.connections = set()
+
+    def count(self, handler, rate_limited=False, bootstrap=False):
+        with self.lock:
+            self.requests += 1
+            self.rate_limited += rate_limited
+            self.bootstraps += bootstrap
+            self.connections.add(handler.client_address)
+
+    def snapshot(self):
+        with self.lock:
+            return {"requests": self.requests, "rate_limited": self.rate_limited,
+                    "bootstraps": self.bootstraps, "connections": len(self.connections)}
+
+class FakeTrendsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like Google
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json; charset=utf-8", headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        state = self.server.state
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if self.command == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+
+        if url.path == "/stats":
+            return self._send(200, json.dumps(state.snapshot()))
+
+        if state.latency:
+            time.sleep(state.latency)
+
+        if url.path.startswith("/trends/explore"):
+            state.count(self, bootstrap=True)
+            return self._send(200, "<html></html>", "text/html",
+                              {"Set-Cookie": "NID=fake-trends-cookie; Path=/"})
+
+        if state.rate_limit_probability and random.random() < state.rate_limit_probability:
+            state.count(self, rate_limited=True)
+            return self._send(429, "Too Many Requests", "text/html")
+        state.count(self)
+
+        if url.path == "/trends/api/explore":
+            req = json.loads(params["req"])
+            request = {"comparisonItem": req["comparisonItem"], "category": req["category"]}
+            widgets = [
+                {"id": "TIMESERIES", "request": request, "token": "timeseries"},
+                {"id": "GEO_MAP", "request": dict(request), "token": "geomap"},
+            ]
+            return self._send(200, ")]}'" + json.dumps({"widgets": widgets}))
+
+        if url.path in ("/trends/api/widgetdata/multiline", "/trends/api/widgetdata/comparedgeo"):
+            request = json.loads(params["req"])
+            items = request["comparisonItem"]
+            keywords = [item["keyword"] for item in items]
+            geo = items[0].get("geo", "") if items else ""
+
+            if url.path.endswith("multiline"):
+                points = timeline(items[0]["time"] if items else "today 12-m")
+                values = keyword_series(keywords, geo, points)
+                rows = [{"time": str(int(point.timestamp())),
+                         "formattedTime": point.strftime("%b %d, %Y"),
+                         "value": [series[i] for series in values],
+                         "isPartial": i == len(points) - 1}
+                        for i, point in enumerate(points)]
+                payload = {"default": {"timelineData": rows}}
+            else:
+                rows = []
+                for name, code in countries:
+                    values = keyword_series(keywords, code, [datetime(2024, 1, 1)])
+                    rows.append({"geoCode": code, "geoName": name, "value": [series[0] for series in values]})
+                payload = {"default": {"geoMapData": rows}}
+
+            if state.payload_padding:
+                payload["padding"] = "x" * state.payload_padding
+            return self._send(200, ")]}',\n" + json.dumps(payload))
+
+        return self._send(404, "Not Found", "text/html")
+
+    do_GET = _handle
+    do_POST = _handle
+
+# Function to start the stand-in server on a background thread; port 0 picks a free port
+def start_server(port=0, latency=0.0, rate_limit_probability=0.0, payload_padding=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeTrendsHandler)
+    server.daemon_threads = True
+    server.state = FakeTrendsState(latency, rate_limit_probability, payload_padding)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/trends"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Google Trends endpoints")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Probability of answering with a 429")
+    parser.add_argument("--padding", type=int, default=0, help="Extra bytes added to every data response")
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.port, args.latency, args.rate_limit, args.padding)
+    print(f"Fake Google Trends server running at {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
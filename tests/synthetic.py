@@ -0,0 +1,15 @@
+import numpy as np
+import pandas as pd
+
+# Synthetic Trends data for the tests that put several responses on one scale
+
+def normalized(frame):
+    # Google scales every response so its largest value is 100
+    return frame * (100.0 / frame.to_numpy().max())
+
+def true_interest(terms, days, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2023-01-01", periods=days, freq="D")
+    levels = rng.uniform(1, 50, len(terms))
+    shapes = 1 + 0.5 * np.sin(np.arange(days)[:, None] / 20 + rng.uniform(0, 6, len(terms)))
+    return pd.DataFrame(levels * shapes, index=index, columns=terms)
@@ -0,0 +1,24 @@
+import numpy as np
+
+import Googletrendanalys as gta
+from synthetic import normalized, true_interest
+
+def test_merge_group_frames_puts_groups_on_the_anchor_scale():
+    terms = ["anchor"] + [f"term {i}" for i in range(8)]
+    truth = true_interest(terms, 60)
+    parts = [normalized(truth[["anchor"] + terms[1:5]]), normalized(truth[["anchor"] + terms[5:]])]
+
+    merged, unscaled = gta.merge_group_frames(parts, "anchor")
+
+    assert unscaled == []
+    assert list(merged.columns) == terms
+    np.testing.assert_allclose(merged.to_numpy(), normalized(truth).to_numpy(), rtol=1e-9)
+    assert merged.attrs["anchor"] == "anchor"
+
+def test_merge_group_frames_drops_terms_without_anchor_data():
+    truth = true_interest(["anchor", "a", "b"], 30)
+    silent = truth[["anchor", "b"]].copy()
+    silent["anchor"] = 0.0
+    merged, unscaled = gta.merge_group_frames([normalized(truth[["anchor", "a"]]), silent], "anchor")
+    assert unscaled == ["b"]
+    assert list(merged.columns) == ["anchor", "a"]
@@ -0,0 +1,34 @@
+import os
+
+import pandas as pd
+
+import Googletrendanalys as gta
+
+def frame(term):
+    return pd.DataFrame({term: range(53)}, index=pd.date_range("2024-01-07", periods=53, freq="W"))
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def test_cache_round_trip_and_key_ignores_term_order(tmp_path):
+    cache = gta.TrendsCache(str(tmp_path))
+    key = cache.make_key("interest_over_time", ["a", "b"], "", "today 12-m")
+    assert key == cache.make_key("interest_over_time", ["b", "a"], "", "today 12-m")
+    assert key != cache.make_key("interest_over_time", ["a", "b"], "", "today 12-m", base_url="http://127.0.0.1/trends")
+
+    cache.put(key, frame("a"))
+    assert cache.get(key)["a"].tolist() == list(range(53))
+    assert cache.hits == 1
+
+def test_cache_stays_under_its_cap_and_tracks_its_size(tmp_path):
+    cache = gta.TrendsCache(str(tmp_path))
+    first = cache.make_key("interest_over_time", ["0"], "", "t")
+    cache.put(first, frame("0"))
+    cache.max_bytes = 20 * directory_size(str(tmp_path))
+
+    for i in range(1, 100):
+        cache.put(cache.make_key("interest_over_time", [str(i)], "", "t"), frame(str(i)))
+
+    assert directory_size(str(tmp_path)) <= cache.max_bytes
+    assert cache.size == directory_size(str(tmp_path))
+    assert cache.get(first) is None  # The least recently used entry went first
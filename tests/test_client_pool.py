@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+import Googletrendanalys as gta
+import fake_trends_server
+
+@pytest.fixture
+def server():
+    server, base_url = fake_trends_server.start_server()
+    server.base_url = base_url
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_scheduler(base_url, workers=4, **limiter_args):
+    pool = gta.TrendsClientPool(size=workers, base_url=base_url, proxies=[])
+    limiter = gta.AdaptiveRateLimiter(rate=200, burst=workers, backoff=0.05, **limiter_args)
+    return gta.FetchScheduler(max_workers=workers, limiter=limiter, pool=pool), pool
+
+def test_pool_reuses_connections_and_one_cookie(server):
+    scheduler, pool = make_scheduler(server.base_url)
+    jobs = [gta.FetchJob([f"term {i}", f"other {i}"], "") for i in range(20)]
+    try:
+        frames = scheduler.run_jobs(jobs)
+    finally:
+        pool.close()
+
+    stats = server.state.snapshot()
+    assert all(frame is not None for frame in frames)
+    assert list(frames[0].columns) == ["term 0", "other 0"]
+    assert stats["bootstraps"] == 1  # The clients created at once share the first one's cookie
+    assert stats["connections"] <= 4  # One keep-alive connection per pooled client
+    assert stats["requests"] == 1 + 2 * len(jobs)  # The cookie, then explore and multiline per job
+
+def test_scheduler_retries_after_rate_limit(server):
+    scheduler, pool = make_scheduler(server.base_url, workers=1)
+    server.state.rate_limit_probability = 1.0
+    frames = []
+    worker = threading.Thread(target=lambda: frames.extend(scheduler.run_jobs([gta.FetchJob(["coffee"], "")])))
+    worker.start()
+    try:
+        deadline = time.monotonic() + 10
+        while server.state.snapshot()["rate_limited"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        server.state.rate_limit_probability = 0.0
+        worker.join(10)
+    finally:
+        pool.close()
+
+    assert server.state.snapshot()["rate_limited"] >= 1
+    assert scheduler.limiter.rate_limited_count >= 1
+    assert frames[0] is not None and list(frames[0].columns) == ["coffee"]
+
+def test_cancel_stops_scheduler_during_backoff(server):
+    scheduler, pool = make_scheduler(server.base_url, workers=1)
+    scheduler.limiter.backoff = 60
+    server.state.rate_limit_probability = 1.0
+    frames = []
+    worker = threading.Thread(target=lambda: frames.extend(scheduler.run_jobs([gta.FetchJob(["tea"], "")])))
+    worker.start()
+    try:
+        deadline = time.monotonic() + 10
+        while server.state.snapshot()["rate_limited"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        scheduler.cancel_event.set()
+        worker.join(5)
+    finally:
+        pool.close()
+
+    assert not worker.is_alive()
+    assert frames == [None]
@@ -0,0 +1,38 @@
+import os
+
+import pandas as pd
+
+import Googletrendanalys as gta
+import fake_trends_server
+
+def test_resumed_journal_replays_complete_records_and_drops_a_partial_one(tmp_path):
+    path = str(tmp_path / "report.journal")
+    jobs = [gta.FetchJob([f"term {i}"], "") for i in range(3)]
+    journal = gta.FetchJournal(path)
+    for i, job in enumerate(jobs[:2]):
+        journal.append(job, pd.DataFrame({job.group[0]: [float(i)]}))
+    journal.close()
+    complete = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write((1000).to_bytes(8, "little") + b"cut short by a crash")
+
+    journal = gta.FetchJournal(path, resume=True)
+    assert os.path.getsize(path) == complete
+    assert journal.get(jobs[1])["term 1"].tolist() == [1.0]
+
+    server, base_url = fake_trends_server.start_server()
+    pool = gta.TrendsClientPool(size=1, base_url=base_url, proxies=[])
+    limiter = gta.AdaptiveRateLimiter(rate=200, burst=1, backoff=0.05)
+    try:
+        frames = gta.FetchScheduler(max_workers=1, limiter=limiter, pool=pool, journal=journal).run_jobs(jobs)
+    finally:
+        pool.close()
+        journal.close()
+        server.shutdown()
+        server.server_close()
+
+    assert frames[0]["term 0"].tolist() == [0.0]
+    assert list(frames[2].columns) == ["term 2"]
+    assert journal.replayed == 1 + 2  # The check above, then the two jobs in the journal
+    assert server.state.snapshot()["requests"] == 1 + 2  # The cookie, then only the job not in the journal
+    assert len(gta.FetchJournal(path, resume=True).entries) == 3
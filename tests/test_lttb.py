@@ -0,0 +1,35 @@
+import numpy as np
+
+import Googletrendanalys as gta
+
+def reference_lttb(x, y, threshold):
+    # Plain single-series LTTB, written from the description of the algorithm
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        a = selected[-1]
+        areas = [abs((x[a] - next_x) * (y[j] - y[a]) - (x[a] - x[j]) * (next_y - y[a])) for j in range(start, end)]
+        selected.append(start + int(np.argmax(areas)))
+    return selected + [n - 1]
+
+def test_lttb_indices_match_the_reference_for_every_column():
+    rng = np.random.default_rng(1)
+    x = np.arange(1000, dtype=float)
+    y = rng.normal(size=(1000, 3)).cumsum(axis=0)
+
+    indices = gta.lttb_indices(x, y, 100)
+
+    assert indices.shape == (100, 3)
+    for column in range(3):
+        assert indices[:, column].tolist() == reference_lttb(x, y[:, column], 100)
+
+def test_lttb_indices_keep_spikes_and_short_series():
+    x = np.arange(500, dtype=float)
+    y = np.zeros((500, 1))
+    y[321, 0] = 100
+    assert 321 in gta.lttb_indices(x, y, 50)[:, 0]
+    np.testing.assert_array_equal(gta.lttb_indices(x[:10], y[:10], 50)[:, 0], np.arange(10))
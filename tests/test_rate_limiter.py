@@ -0,0 +1,53 @@
+import threading
+import time
+
+import Googletrendanalys as gta
+
+def test_in_flight_rate_limits_count_as_one_episode():
+    limiter = gta.AdaptiveRateLimiter(rate=1.0, burst=4, backoff=60, jitter=0, decrease=0.5)
+    sent = threading.Barrier(4)
+    delays = []
+
+    def request():
+        limiter.acquire()
+        sent.wait()  # All four are in flight before the first 429 comes back
+        delays.append(limiter.on_rate_limited())
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert limiter.rate == 0.5
+    assert limiter.consecutive_limits == 1
+    assert max(delays) <= 60
+    assert limiter.rate_limited_count == 4
+
+def test_rate_limit_after_a_pause_escalates_the_backoff():
+    limiter = gta.AdaptiveRateLimiter(rate=1.0, burst=4, backoff=0.01, jitter=0, decrease=0.5)
+    limiter.acquire()
+    first = limiter.on_rate_limited()
+    limiter.acquire()  # Sent once the pause is over
+    second = limiter.on_rate_limited()
+    assert second == 2 * first
+    assert limiter.rate == 0.25
+
+def test_success_in_flight_before_a_pause_does_not_reset_the_backoff():
+    limiter = gta.AdaptiveRateLimiter(rate=1.0, burst=4, backoff=0.01, jitter=0)
+    limiter.acquire()
+    limiter.on_rate_limited()
+    limiter.sent.episode = 0  # As if this request was sent before the pause
+    limiter.on_success()
+    assert limiter.consecutive_limits == 1
+
+def test_requests_after_a_pause_are_spaced_by_the_rate():
+    limiter = gta.AdaptiveRateLimiter(rate=10.0, burst=4, backoff=0.3, jitter=0, decrease=1.0)
+    limiter.acquire()
+    limiter.on_rate_limited()
+    sent = []
+    for _ in range(3):
+        limiter.acquire()
+        sent.append(time.monotonic())
+
+    assert all(later - earlier >= 0.09 for earlier, later in zip(sent, sent[1:]))
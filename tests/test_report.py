@@ -0,0 +1,36 @@
+import itertools
+
+import pandas as pd
+
+import Googletrendanalys as gta
+
+def test_report_escapes_terms_in_the_page():
+    term = '<script>alert("x")</script>'
+    stats = pd.DataFrame({"term": [term]})
+    chunks = gta.html_report_chunks("<div>graph</div>", stats, [term], [term], [], pd.DataFrame(), True, {})
+    # Everything up to the graph: the missing terms banner, the map heading and the term picker
+    page = "".join(itertools.takewhile(lambda chunk: chunk != "<div>graph</div>", chunks))
+
+    assert "<script>alert" not in page
+    assert page.count("&lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt;") == 4  # Banner, heading, option value and text
+    assert ">&lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt;</option>" in page
+
+def test_write_report_counts_bytes(tmp_path):
+    path = tmp_path / "report.html"
+    written = gta.write_report(str(path), ["<p>", "Zürich café 東京", "</p>\n"])
+    assert written == path.stat().st_size
+    assert path.read_text(encoding="utf-8") == "<p>Zürich café 東京</p>\n"
+
+def test_report_escapes_region_labels():
+    stats = pd.DataFrame({"term": ["coffee"]})
+    chunks = gta.html_report_chunks("<div>graph</div>", stats, ["coffee"], ["coffee"], ["<b>x</b>"],
+                                    pd.DataFrame(), True, {})
+    # Everything up to the stats table header; its rows come after
+    page = ""
+    for chunk in chunks:
+        page += chunk
+        if "<thead>" in chunk:
+            break
+
+    assert "<b>x</b>" not in page
+    assert "&lt;b&gt;x&lt;/b&gt; Year Avg" in page
@@ -0,0 +1,29 @@
+import json
+from http import HTTPStatus
+
+import pytest
+
+import trends_service
+
+@pytest.mark.parametrize("body", [
+    {"terms": ["coffee"], "anchor": 5},
+    {"terms": ["coffee"], "timeframe": ["today 12-m"]},
+    {"terms": ["coffee"], "daily": "yes"},
+    {"terms": ["coffee"], "top": "10"},
+    {"terms": ["coffee"], "regions": ["<b>x</b>"]},
+])
+def test_invalid_run_requests_are_rejected(tmp_path, body):
+    service = trends_service.TrendsService(str(tmp_path))
+    status, _, content = service.route("POST", "/runs", json.dumps(body).encode("utf-8"))
+    assert status == HTTPStatus.BAD_REQUEST
+    assert "error" in json.loads(content)
+    assert not service.runs
+
+def test_only_the_newest_finished_runs_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(trends_service, "max_kept_runs", 2)
+    service = trends_service.TrendsService(str(tmp_path))
+    for run_id, status in (("a", "done"), ("b", "running"), ("c", "failed"), ("d", "done")):
+        service.runs[run_id] = type("Run", (), {"status": status})()
+
+    service._drop_finished_runs()
+    assert list(service.runs) == ["b", "c", "d"]
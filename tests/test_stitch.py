@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+import Googletrendanalys as gta
+from synthetic import normalized, true_interest
+
+def test_stitch_frames_recovers_one_scale_across_windows():
+    truth = true_interest(["coffee", "tea"], 400)
+    windows = [truth.iloc[0:200], truth.iloc[150:350], truth.iloc[300:400]]
+    stitched = gta.stitch_frames([normalized(window) for window in windows])
+
+    assert stitched.index.equals(truth.index)
+    np.testing.assert_allclose(stitched.to_numpy(), normalized(truth).to_numpy(), rtol=1e-9)
+
+def test_stitch_timeframes_windows_overlap_and_cover_the_span():
+    today = pd.Timestamp("2024-06-30")
+    windows = gta.stitch_timeframes("2020-01-01 2024-06-30", today=today)
+    spans = [[pd.Timestamp(part) for part in window.split(" ")] for window in windows]
+
+    assert len(spans) > 1
+    assert spans[0][0] <= pd.Timestamp("2020-01-01") and spans[-1][1] == today
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        assert (end - start).days + 1 == gta.stitch_overlap_days
+    assert gta.stitch_timeframes("today 3-m", today=today) == ["today 3-m"]
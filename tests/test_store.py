@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+import Googletrendanalys as gta
+
+def frame(index, terms, level):
+    return pd.DataFrame({term: np.full(len(index), level + i, dtype=float) for i, term in enumerate(terms)},
+                        index=pd.DatetimeIndex(index, name="date"))
+
+def region_frame(terms):
+    return pd.DataFrame({term: [50.0, 100.0] for term in terms}, index=pd.Index(["Canada", "Germany"], name="geoName"))
+
+def test_from_store_only_reads_the_requested_timeframe(tmp_path):
+    store = gta.TrendsStore(str(tmp_path / "store"))
+    terms = ["coffee", "tea"]
+    weekly = frame(pd.date_range("2024-01-07", periods=53, freq="W"), terms, 10)
+    daily = frame(pd.date_range("2020-01-01", periods=1800, freq="D"), terms, 60)
+    gta.save_comparison(store, weekly, {}, region_frame(terms), "today 12-m")
+    gta.save_comparison(store, daily, {}, region_frame(terms), gta.stored_timeframe("today 5-y", daily=True))
+
+    run = gta.ComparisonRun(terms, timeframe="today 12-m", output_dir=str(tmp_path), store=store, from_store=True)
+    run._fetch()
+
+    assert len(run.all_data) == 53
+    assert run.all_data.index.min() == weekly.index.min()
+    assert run.missing_terms == []
+
+def test_from_store_scales_runs_through_the_stored_anchor(tmp_path, capsys):
+    store = gta.TrendsStore(str(tmp_path / "store"))
+    index = pd.date_range("2024-01-07", periods=10, freq="W")
+    truth = {"anchor": 50.0, "b": 25.0, "c": 10.0, "d": 40.0}
+    first = pd.DataFrame({term: truth[term] * 2.0 for term in ["anchor", "b", "c"]}, index=pd.DatetimeIndex(index, name="date"))
+    second = pd.DataFrame({term: truth[term] * 2.0 for term in ["anchor", "d"]}, index=pd.DatetimeIndex(index, name="date"))
+    for data, fetched_at in ((first, "2024-03-01"), (second, "2024-03-02")):
+        data.attrs["anchor"] = "anchor"
+        store.append("interest_over_time", '', data, "today 12-m", pd.Timestamp(fetched_at, tz="UTC"))
+
+    run = gta.ComparisonRun(["b", "d"], output_dir=str(tmp_path), store=store, from_store=True)
+    run._fetch()
+
+    assert "shares no terms" not in capsys.readouterr().out
+    assert list(run.all_data.columns) == ["b", "d"]
+    np.testing.assert_allclose(run.all_data["b"] / run.all_data["d"], truth["b"] / truth["d"])
@@ -0,0 +1,24 @@
+from collections import Counter
+
+import Googletrendanalys as gta
+
+def test_clean_terms_skips_blanks_and_repeats_ignoring_case():
+    duplicates = Counter()
+    terms = list(gta.clean_terms(["Coffee", " green  tea ", "", "coffee", "Green Tea", "  "], duplicates))
+    assert terms == ["Coffee", "green tea"]
+    assert duplicates == {"Coffee": 1, "green tea": 1}
+
+def test_term_stream_follows_the_same_rules_as_typed_terms(tmp_path):
+    typed = ["Coffee", "tea", "COFFEE", " mate ", "Tea"]
+    path = tmp_path / "terms.csv"
+    path.write_text("Coffee,tea\nCOFFEE, mate \n", encoding="utf-8")
+
+    stream = gta.TermStream(str(path), extra_terms=["Tea"])
+    assert list(stream) == list(gta.clean_terms(typed)) == ["Coffee", "tea", "mate"]
+    assert stream.duplicates == 2
+
+def test_term_stream_reads_one_csv_column(tmp_path):
+    path = tmp_path / "keywords.csv"
+    path.write_text("keyword,volume\nespresso,10\nlatte,5\nEspresso,1\n", encoding="utf-8")
+    assert list(gta.TermStream(str(path), "keyword")) == ["espresso", "latte"]
+    assert list(gta.TermStream(str(path), "2")) == ["volume", "10", "5", "1"]
@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import json
+import mimetypes
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlparse, unquote
+
+import Googletrendanalys as gta
+
+# Local HTTP service that runs comparisons on request. Many runs go at once: they share one rate limiter,
+# the response cache and the client pool, so together they stay under the request rate Google allows and
+# a term fetched by one run is a cache hit for the next. Finished reports and their data are served from here.
+#
+#   POST /runs                  start a run from a JSON body: {"terms": [...], "regions": [...], "timeframe": ...,
+#                               "daily": false, "anchor": null, "map": false, "top": 10}
+#   GET  /runs                  every run and its status
+#   GET  /runs/<id>             the status of a run, with its stats and timings once it is finished
+#   GET  /runs/<id>/data        the series of a finished run, in the format embedded in its report
+#   POST /runs/<id>/cancel      cancel a run; it still writes a report from what it fetched
+#   GET  /reports/<file>        the report pages and their assets
+
+max_request_bytes = 1024 * 1024  # Largest request body accepted
+max_service_runs = 4  # Runs executing at once; further runs wait for a free slot
+max_kept_runs = 100  # Finished runs kept for their status and data; older ones are dropped
+region_code_pattern = re.compile(r"^[A-Z]{2}(-[A-Z0-9]{1,3})?$")  # A country code, optionally with a subdivision
+
+class TrendsService:
+    def __init__(self, output_dir="reports", max_runs=max_service_runs, rate=gta.request_rate):
+        self.output_dir = output_dir
+        self.limiter = gta.AdaptiveRateLimiter(rate=rate)
+        self.executor = ThreadPoolExecutor(max_workers=max_runs, thread_name_prefix="run")
+        self.runs = {}  # Run id to ComparisonRun, in the order they were submitted
+
+    # Function to create a run from a request body and queue it; returns its id
+    def submit(self, body):
+        if not isinstance(body, dict):
+            raise ValueError("the request body must be a JSON object")
+        terms = body.get("terms")
+        if not isinstance(terms, list) or not all(isinstance(term, str) for term in terms):
+            raise ValueError("terms must be a list of strings")
+        regions = body.get("regions") or []
+        if not isinstance(regions, list) or not all(isinstance(region, str) for region in regions):
+            raise ValueError("regions must be a list of region codes")
+        invalid = [region for region in regions if not region_code_pattern.fullmatch(region)]
+        if invalid:
+            raise ValueError(f"invalid region codes: {', '.join(invalid)}")
+        for key in ("timeframe", "anchor"):
+            if body.get(key) is not None and not isinstance(body[key], str):
+                raise ValueError(f"{key} must be a string")
+        for key in ("daily", "map"):
+            if body.get(key) is not None and not isinstance(body[key], bool):
+                raise ValueError(f"{key} must be true or false")
+        top = body.get("top")
+        if top is not None and (isinstance(top, bool) or not isinstance(top, int) or top < 1):
+            raise ValueError("top must be a positive integer")
+
+        run_id = uuid.uuid4().hex[:12]
+        run = gta.ComparisonRun(terms, regions, bool(body.get("map")), body.get("anchor"),
+                                body.get("timeframe") or 'today 12-m', self.output_dir, f"{run_id}.html",
+                                visible=int(body.get("top") or gta.visible_series), daily=bool(body.get("daily")),
+                                limiter=self.limiter)
+        self.runs[run_id] = run
+        self._drop_finished_runs()
+        future = asyncio.get_running_loop().run_in_executor(self.executor, run.execute)
+        future.add_done_callback(lambda done: self._finished(run_id, done))
+        return run_id
+
+    # Function to forget the oldest finished runs beyond max_kept_runs; their reports stay on disk
+    def _drop_finished_runs(self):
+        finished = [run_id for run_id, run in self.runs.items() if run.status in ("done", "failed")]
+        for run_id in finished[:max(0, len(finished) - max_kept_runs)]:
+            del self.runs[run_id]
+
+    def _finished(self, run_id, future):
+        # The error is kept on the run and reported through its status
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Run {run_id} failed: {future.exception()}")
+
+    def describe(self, run_id, run, full=False):
+        result = run.result()
+        if not full:
+            result = {key: result[key] for key in ("status", "error", "progress", "cancelled", "timeframe")}
+        result["id"] = run_id
+        if run.status == "done":
+            result["report_url"] = f"/reports/{run_id}.html"
+            result["data_url"] = f"/runs/{run_id}/data"
+        return result
+
+    def status(self):
+        return {
+            "runs": len(self.runs),
+            "running": sum(run.status == "running" for run in self.runs.values()),
+            "limiter": self.limiter.metrics(),
+            "cache": gta.trends_cache.totals(),
+        }
+
+    # Function to answer one request; returns the status, the content type and the body as bytes or chunks
+    def route(self, method, path, body):
+        parts = [unquote(part) for part in urlparse(path).path.split("/") if part]
+        if method == "GET" and not parts:
+            return json_response(self.status())
+        if parts[:1] == ["runs"]:
+            if len(parts) == 1 and method == "POST":
+                try:
+                    run_id = self.submit(json.loads(body or b"{}"))
+                except (ValueError, TypeError) as e:
+                    return json_response({"error": str(e)}, HTTPStatus.BAD_REQUEST)
+                return json_response(self.describe(run_id, self.runs[run_id]), HTTPStatus.ACCEPTED)
+            if len(parts) == 1 and method == "GET":
+                return json_response([self.describe(run_id, run) for run_id, run in self.runs.items()])
+
+            run = self.runs.get(parts[1]) if len(parts) > 1 else None
+            if run is None:
+                return json_response({"error": "no such run"}, HTTPStatus.NOT_FOUND)
+            if len(parts) == 2 and method == "GET":
+                return json_response(self.describe(parts[1], run, full=True))
+            if parts[2:] == ["cancel"] and method == "POST":
+                run.cancel_event.set()
+                return json_response(self.describe(parts[1], run))
+            if parts[2:] == ["data"] and method == "GET":
+                if run.status != "done":
+                    return json_response({"error": f"run is {run.status}"}, HTTPStatus.CONFLICT)
+                return (HTTPStatus.OK, "application/json",
+                        gta.report_data_chunks(run.all_data, run.region_data, run.region_interest))
+        if parts[:1] == ["reports"] and method == "GET":
+            return self.report_file(parts[1:])
+        return json_response({"error": "not found"}, HTTPStatus.NOT_FOUND)
+
+    def report_file(self, parts):
+        # Only files inside the output directory are served
+        root = os.path.realpath(self.output_dir)
+        path = os.path.realpath(os.path.join(root, *parts))
+        if not parts or os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            return json_response({"error": "not found"}, HTTPStatus.NOT_FOUND)
+        with open(path, "rb") as f:
+            content = f.read()
+        return HTTPStatus.OK, mimetypes.guess_type(path)[0] or "application/octet-stream", content
+
+    # Function to handle one connection: read a request, answer it and close the connection
+    async def handle(self, reader, writer):
+        try:
+            try:
+                status, content_type, content = await self.respond(reader)
+                if isinstance(content, bytes):
+                    content = [content]
+                else:
+                    # Chunks are built on a worker thread, as a large frame takes a while to convert
+                    content = await asyncio.get_running_loop().run_in_executor(
+                        None, lambda: ["".join(content).encode("utf-8")])
+            except (ConnectionError, asyncio.IncompleteReadError):
+                raise
+            except Exception as e:
+                # A bug in one request is reported to its client rather than dropping the connection
+                print(f"Request failed: {e!r}")
+                status, content_type, content = json_response({"error": "internal error"},
+                                                              HTTPStatus.INTERNAL_SERVER_ERROR)
+                content = [content]
+            length = sum(len(chunk) for chunk in content)
+            writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {length}\r\nConnection: close\r\n\r\n".encode("latin-1"))
+            for chunk in content:
+                writer.write(chunk)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            return json_response({"error": "bad request"}, HTTPStatus.BAD_REQUEST)
+        method, path, _ = request_line
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length") or 0)
+        if length > max_request_bytes:
+            return json_response({"error": "request body too large"}, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        body = await reader.readexactly(length) if length else b""
+        return self.route(method, path, body)
+
+# Function to build a JSON response; NaN and other values JSON lacks become null or strings
+def json_response(value, status=HTTPStatus.OK):
+    return status, "application/json", json.dumps(value, default=str).encode("utf-8")
+
+async def serve(service, host="127.0.0.1", port=8080):
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Trends service running at http://{host}:{server.sockets[0].getsockname()[1]}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local service that runs Google Trends comparisons on request")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--output-dir", default="reports", help="Directory the reports are written to")
+    parser.add_argument("--max-runs", type=int, default=max_service_runs, help="Runs executing at once")
+    parser.add_argument("--rate", type=float, default=gta.request_rate,
+                        help="Requests per second shared by all runs")
+    parser.add_argument("--base-url", help="Trends endpoint to use instead of Google, e.g. fake_trends_server.py")
+    args = parser.parse_args()
+
+    if args.base_url:
+        gta.trends_client_pool.base_url = args.base_url
+    service = TrendsService(args.output_dir, args.max_runs, args.rate)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        for run in service.runs.values():
+            run.cancel_event.set()
+        service.executor.shutdown(wait=True)